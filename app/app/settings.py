@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -46,11 +47,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,20 +78,122 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
+REST_FRAMEWORK = {
+    # orjson backed when it is installed, with the same output as the DRF defaults
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # django's postgresql backend with health checks and an optional pool, see core.db.postgresql
+        'ENGINE': 'core.db.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # seconds a connection is kept open between requests, 0 closes it after every request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        # behind PgBouncer in transaction pooling mode cursors cannot outlive a transaction
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER', '0') == '1',
+        'POOL': None,
+    }
+}
+
+# an in-process pool shared by the threads of a worker. connections go back
+# to the pool after every request instead of staying with their thread
+if os.environ.get('DB_POOL_MAX_SIZE'):
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'max_lifetime': int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        },
+    })
+
+# read replicas, as comma separated hosts. safe requests to views opting in
+# with replica_actions read from them, see core.db.routers
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+# a client that wrote reads from the primary for this long, longer than the
+# replication lag. the cache holding this must be shared between workers,
+# with replicas configured a local memory cache fails the system checks
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+DATABASE_REPLICA_CACHE_ALIAS = 'default'
+
+
+# per endpoint query, latency and size profile of every request, served in
+# prometheus format at api/status/metrics/. a share of the requests can be
+# run under cProfile, their stats are dumped to the directory
+PROFILING = os.environ.get('PROFILING', '0') == '1'
+PROFILING_DUPLICATE_QUERIES = 5
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DUMP_DIR = os.environ.get('PROFILING_DUMP_DIR')
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# local memory by default, redis (django-redis) when REDIS_URL is set
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+    }
+
+RECIPE_CACHE_ALIAS = 'default'
+RECIPE_ATTR_CACHE_TIMEOUT = 300
+
+# typeahead over tag and ingredient names. prefix lookups come from an
+# in-process trie per user, fuzzy searches must finish within the budget.
+# version bumps only reach other workers through a shared RECIPE_CACHE_ALIAS,
+# the ttl bounds how long they may serve a stale trie otherwise
+RECIPE_AUTOCOMPLETE_CACHE_SIZE = 1024
+RECIPE_AUTOCOMPLETE_CACHE_TTL = 60
+RECIPE_AUTOCOMPLETE_BUDGET_MS = 50
+
+# per-user tag and ingredient matrices behind the similar recipes action,
+# held in-process. numpy and scipy are used when installed. like the tries
+# they are dropped after the ttl in case a bump from another worker was missed
+RECIPE_SIMILARITY_CACHE_SIZE = 256
+RECIPE_SIMILARITY_CACHE_TTL = 60
+
+# builds recipe list responses from values() rows instead of model instances,
+# see recipe.fastpath. the output is the same as RecipeSerializer's
+RECIPE_FAST_LIST = os.environ.get('RECIPE_FAST_LIST', '0') == '1'
+
+# token -> user lookups made by core.authentication.CachedTokenAuthentication.
+# without an alias entries are kept in an in-process LRU, and a deleted token
+# or deactivated user stays authenticated on the other workers for up to the
+# ttl. set the alias to a shared cache to have invalidation reach every worker
+AUTH_TOKEN_CACHE_SIZE = 4096
+AUTH_TOKEN_CACHE_TTL = 60
+AUTH_TOKEN_CACHE_ALIAS = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -132,6 +237,25 @@ STATIC_ROOT = '/vol/web/static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 
+# resized copies of recipe images, as {name: longest side in px}.
+# processing runs on a thread pool, 'sync' runs it inline after commit
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': 100,
+    'medium': 600,
+}
+# uploads larger than this are rejected while streaming, before they are decoded
+RECIPE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+RECIPE_IMAGE_MAX_SIDE = 10_000
+RECIPE_IMAGE_PROCESSING = os.environ.get('RECIPE_IMAGE_PROCESSING', 'thread')
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+
+# async read routes under api/async/recipe/ run their queries on a pool of
+# database threads, each keeping its connection for CONN_MAX_AGE. 'sync'
+# runs them on django's shared sync thread instead
+RECIPE_ASYNC_DB_EXECUTOR = os.environ.get('RECIPE_ASYNC_DB_EXECUTOR', 'thread')
+RECIPE_ASYNC_DB_WORKERS = int(os.environ.get('RECIPE_ASYNC_DB_WORKERS', 8))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
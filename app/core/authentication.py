@@ -0,0 +1,63 @@
+import copy
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.cache import LRUCache
+
+local_cache = LRUCache(max_size=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL)
+
+
+def _shared_cache():
+    if settings.AUTH_TOKEN_CACHE_ALIAS is None:
+        return None
+    return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+
+def _shared_key(key):
+    return f'auth:token:{key}'
+
+
+def invalidate_token(key):
+    local_cache.delete(key)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete(_shared_key(key))
+
+
+def invalidate_user(user_id):
+    local_cache.delete_where(lambda entry: entry[0].pk == user_id)
+    shared = _shared_cache()
+    if shared is not None:
+        keys = Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+        shared.delete_many([_shared_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    drop-in TokenAuthentication that remembers token -> user lookups for
+    AUTH_TOKEN_CACHE_TTL seconds. entries are invalidated by core.signals when
+    the token is deleted or the user is changed or deactivated. they live in
+    the shared django cache of AUTH_TOKEN_CACHE_ALIAS when it is set, so the
+    invalidation reaches every worker, otherwise in a bounded in-process LRU.
+    """
+
+    def authenticate_credentials(self, key):
+        shared = _shared_cache()
+        if shared is not None:
+            entry = shared.get(_shared_key(key))
+            if entry is None:
+                entry = super().authenticate_credentials(key)
+                shared.set(_shared_key(key), entry, settings.AUTH_TOKEN_CACHE_TTL)
+        else:
+            entry = local_cache.get(key)
+            if entry is None:
+                entry = super().authenticate_credentials(key)
+                local_cache.set(key, entry)
+
+        # hand every request its own instances, views are free to modify them
+        user, token = copy.copy(entry[0]), copy.copy(entry[1])
+        token.user = user
+        return user, token
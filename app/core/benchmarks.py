@@ -0,0 +1,30 @@
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(samples, p):
+    """nearest rank percentile of sorted samples"""
+    if not samples:
+        return None
+    return samples[max(1, -(-p * len(samples) // 100)) - 1]
+
+
+def summarize(durations, elapsed, errors=0, queries=None):
+    """
+    throughput and latency of a benchmark run from the durations in seconds
+    of its successful requests, elapsed the seconds the whole run took
+    """
+    samples = sorted(duration * 1000 for duration in durations)
+    result = {
+        'requests': len(samples) + errors,
+        'errors': errors,
+        'throughput': round((len(samples) + errors) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(samples) / len(samples), 3) if samples else None,
+        'max_ms': round(samples[-1], 3) if samples else None,
+    }
+    for p in PERCENTILES:
+        value = percentile(samples, p)
+        result[f'p{p}_ms'] = round(value, 3) if value is not None else None
+    if queries:
+        result['queries_mean'] = round(sum(queries) / len(queries), 2)
+        result['queries_max'] = max(queries)
+    return result
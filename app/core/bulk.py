@@ -0,0 +1,78 @@
+import io
+
+from django.db import connections, router, transaction
+from django.db.models import CASCADE, DO_NOTHING, AutoField
+
+
+def bulk_create_with_pks(model, objs, batch_size=None, using=None):
+    """
+    bulk_create that sets primary keys on the created objects on every backend.
+    backends that cannot return rows from a bulk insert get one INSERT per
+    object instead, which like bulk_create sends no per-object signals.
+    """
+    using = using or router.db_for_write(model)
+    manager = model._base_manager.db_manager(using)
+    if connections[using].features.can_return_rows_from_bulk_insert:
+        return manager.bulk_create(objs, batch_size=batch_size)
+
+    fields = [field for field in model._meta.concrete_fields if not isinstance(field, AutoField)]
+    returning_fields = model._meta.db_returning_fields
+    with transaction.atomic(using=using, savepoint=False):
+        for obj in objs:
+            row = manager._insert([obj], fields=fields, returning_fields=returning_fields, using=using)[0]
+            for value, field in zip(row, returning_fields):
+                setattr(obj, field.attname, value)
+            obj._state.adding = False
+            obj._state.db = using
+    return objs
+
+
+def delete_without_signals(queryset):
+    """
+    deletes the rows of queryset with a single DELETE instead of collecting
+    them first. no signals are sent and nothing is cascaded, rows pointing at
+    them have to be deleted beforehand.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
+def delete_cascade_without_signals(queryset):
+    """
+    like delete_without_signals, after deleting the rows cascading from
+    queryset and their m2m links the same way, one DELETE per table. nothing
+    is loaded and no signals are sent, data the receivers would have kept up
+    to date has to be dealt with by the caller.
+    """
+    model = queryset.model
+    pks = queryset.values('pk')
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        delete_without_signals(through._base_manager.filter(**{f'{field.m2m_field_name()}__in': pks}))
+    for relation in model._meta.related_objects:
+        if relation.many_to_many:
+            lookup = f'{relation.field.m2m_reverse_field_name()}__in'
+            delete_without_signals(relation.through._base_manager.filter(**{lookup: pks}))
+        elif relation.on_delete is CASCADE:
+            related = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': pks})
+            delete_cascade_without_signals(related)
+        elif relation.on_delete is not DO_NOTHING:
+            raise ValueError(f'{relation.related_model.__name__}.{relation.field.name} is not deleted on cascade.')
+    return delete_without_signals(queryset)
+
+
+def bulk_create_links(through, column, rows, using=None, use_copy=True):
+    """
+    inserts (recipe id, related id) rows into an m2m through table, with
+    postgres COPY when use_copy is set and the database supports it.
+    """
+    if not rows:
+        return
+    using = using or router.db_for_write(through)
+    if not use_copy or connections[using].vendor != 'postgresql':
+        links = [through(recipe_id=recipe_id, **{column: pk}) for recipe_id, pk in rows]
+        through.objects.using(using).bulk_create(links)
+        return
+    # ids only, so tab separated text needs no quoting
+    buffer = io.StringIO(''.join(f'{recipe_id}\t{pk}\n' for recipe_id, pk in rows))
+    with connections[using].cursor() as cursor:
+        cursor.copy_from(buffer, through._meta.db_table, columns=('recipe_id', column))
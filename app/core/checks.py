@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# caches every worker process keeps for itself
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_replica_cache(app_configs, **kwargs):
+    """a client kept on the primary after a write must be kept there by every worker"""
+    if not settings.DATABASE_REPLICAS:
+        return []
+    alias = settings.DATABASE_REPLICA_CACHE_ALIAS
+    if settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f'DATABASE_REPLICA_CACHE_ALIAS {alias!r} is not shared between worker processes.',
+            hint='Set REDIS_URL or point DATABASE_REPLICA_CACHE_ALIAS to a shared cache.',
+            id='core.E001',
+        )]
+    return []
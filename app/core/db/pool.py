@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    a thread safe, size bounded pool of open DB-API connections. acquire()
+    hands out an idle connection or opens a new one below max_size, waiting
+    up to timeout seconds otherwise. connections older than max_lifetime,
+    failing check or failing reset on release are closed instead of reused.
+    """
+
+    def __init__(self, max_size=10, timeout=5.0, max_lifetime=None, check=None, reset=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._check = check
+        self._reset = reset
+        self._idle = deque()
+        self._created_at = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._counters = dict.fromkeys(('checkouts', 'waits', 'timeouts', 'created', 'discarded'), 0)
+
+    def acquire(self, connect):
+        """an open connection, connect() opens a new one when none is idle"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection = self._checkout(deadline)
+            if connection is None:
+                return self._open(connect)
+            if not self._expired(connection) and (self._check is None or self._check(connection)):
+                return connection
+            self._discard(connection)
+
+    def release(self, connection):
+        if self._expired(connection) or (self._reset is not None and not self._reset(connection)):
+            self._discard(connection)
+            return
+        with self._cond:
+            self._idle.append(connection)
+            self._cond.notify()
+
+    def close(self):
+        """closes the idle connections, checked out ones are closed when released"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                **self._counters,
+            }
+
+    def _checkout(self, deadline):
+        """an idle connection, or None once a slot for a new connection is reserved"""
+        with self._cond:
+            waited = False
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(f'no connection available within {self.timeout}s ({self.max_size} in use)')
+                waited = True
+                self._cond.wait(remaining)
+            self._counters['checkouts'] += 1
+            self._counters['waits'] += waited
+            if self._idle:
+                # most recently used first, so surplus connections age out
+                return self._idle.pop()
+            self._size += 1
+            return None
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created_at[id(connection)] = time.monotonic()
+            self._counters['created'] += 1
+        return connection
+
+    def _expired(self, connection):
+        if self.max_lifetime is None:
+            return False
+        with self._cond:
+            created_at = self._created_at.get(id(connection))
+        return created_at is None or time.monotonic() - created_at >= self.max_lifetime
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created_at.pop(id(connection), None)
+            self._size -= 1
+            self._counters['discarded'] += 1
+            self._cond.notify()
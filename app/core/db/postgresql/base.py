@@ -0,0 +1,115 @@
+import threading
+from collections import Counter
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.base import Database
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from core.db.pool import ConnectionPool, PoolTimeout
+
+_pools = {}
+_opened = Counter()
+_lock = threading.Lock()
+
+
+def ping(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Database.Error:
+        return False
+    return True
+
+
+def reset(connection):
+    """rolls back what a released connection left open, False when it cannot be reused"""
+    if connection.closed:
+        return False
+    try:
+        if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        # so health checks in the pool do not open a transaction, connect() sets it again anyway
+        connection.autocommit = True
+    except Database.Error:
+        return False
+    return connection.get_transaction_status() == TRANSACTION_STATUS_IDLE
+
+
+def close_pools():
+    """closes the idle connections of every pool and forgets the pools"""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    the postgresql backend plus what django 3.2 lacks for connection reuse.
+    with CONN_HEALTH_CHECKS a persistent connection is checked with a
+    SELECT 1 before its first query of a request, so a connection the server
+    or a bouncer dropped is replaced instead of failing the request. POOL
+    ({'max_size', 'timeout', 'max_lifetime'}) hands connections back to an
+    in-process pool shared by all threads instead of closing them.
+    """
+
+    health_check_pending = False
+
+    def get_pool(self):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        # the test runner renames the database in place, so the name is part of the key
+        key = (self.alias, self.settings_dict['NAME'])
+        with _lock:
+            if key not in _pools:
+                check = ping if self.settings_dict.get('CONN_HEALTH_CHECKS') else None
+                _pools[key] = ConnectionPool(check=check, reset=reset, **options)
+            return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool()
+        if pool is None:
+            with _lock:
+                _opened[self.alias] += 1
+            return super().get_new_connection(conn_params)
+        try:
+            connection = pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc)) from exc
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        pool = self.get_pool()
+        if pool is None:
+            return super()._close()
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                pool.release(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # runs when a request starts and finishes, check before the next query
+        self.health_check_pending = self.connection is not None and bool(self.settings_dict.get('CONN_HEALTH_CHECKS'))
+
+    def ensure_connection(self):
+        if self.health_check_pending:
+            self.health_check_pending = False
+            if self.connection is not None and not self.in_atomic_block and not self.is_usable():
+                self.close()
+        super().ensure_connection()
+
+    def metrics(self):
+        pool = self.get_pool()
+        with _lock:
+            opened = _opened[self.alias]
+        return {
+            'vendor': self.vendor,
+            'conn_max_age': self.settings_dict['CONN_MAX_AGE'],
+            'health_checks': bool(self.settings_dict.get('CONN_HEALTH_CHECKS')),
+            'server_side_cursors': not self.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'),
+            'connections_opened': pool.stats()['created'] if pool else opened,
+            'pool': pool.stats() if pool else None,
+        }
@@ -0,0 +1,76 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# the replica the reads of the current context go to, None for the primary
+_replica = ContextVar('replica', default=None)
+
+
+def replica_reads_enabled():
+    return _replica.get() is not None
+
+
+def current_replica():
+    return _replica.get()
+
+
+def enable_replica_reads(enabled=True):
+    """
+    lets reads of the current context go to a replica, returns a token for
+    reset_replica_reads(). one of DATABASE_REPLICAS is picked for the whole
+    context, so its reads see one point in time, enabled can also name it.
+    """
+    if enabled is True:
+        enabled = random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None
+    return _replica.set(enabled or None)
+
+
+def reset_replica_reads(token):
+    _replica.reset(token)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = enable_replica_reads(enabled)
+    try:
+        yield
+    finally:
+        reset_replica_reads(token)
+
+
+class ReplicaRouter:
+    """
+    sends reads of the core models to one of DATABASE_REPLICAS while replica
+    reads are enabled, see core.middleware.ReplicaRoutingMiddleware, and
+    everything else to the primary. reads inside a transaction on the
+    primary stay there, so code reading back its own writes sees them.
+    """
+
+    route_app_labels = {'core'}
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None or model._meta.app_label not in self.route_app_labels:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # an instance read from a replica is written to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema from the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
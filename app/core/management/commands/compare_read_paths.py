@@ -0,0 +1,70 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import percentile
+
+ENDPOINTS = ('recipes/', 'tags/', 'ingredient/')
+
+
+def fetch(url, token, timeout):
+    """(seconds, status) of one GET, status 0 when the request failed"""
+    request = urllib.request.Request(url, headers={'Authorization': f'Token {token}'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as exc:
+        status = exc.code
+    except OSError:
+        status = 0
+    return time.perf_counter() - started, status
+
+
+class Command(BaseCommand):
+    help = 'load tests the read endpoints of a WSGI and an ASGI deployment with the same requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--token', required=True, help='api token of the user the requests are made for')
+        parser.add_argument('--wsgi-url', default='http://localhost:8000/api/recipe/')
+        parser.add_argument('--asgi-url', default='http://localhost:8001/api/async/recipe/')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help=f'defaults to {", ".join(ENDPOINTS)}')
+        parser.add_argument('--requests', type=int, default=500, help='requests per endpoint and deployment')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=20, help='requests sent first and not measured')
+        parser.add_argument('--timeout', type=float, default=10)
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        if options['requests'] <= 0 or options['concurrency'] <= 0:
+            raise CommandError('--requests and --concurrency must be positive.')
+        bases = (('wsgi', options['wsgi_url']), ('asgi', options['asgi_url']))
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for endpoint in options['endpoints'] or ENDPOINTS:
+                for name, base in bases:
+                    url = base.rstrip('/') + '/' + endpoint.lstrip('/')
+                    self._run(pool, name, url, options)
+
+    def _run(self, pool, name, url, options):
+        def get(_):
+            return fetch(url, options['token'], options['timeout'])
+
+        list(pool.map(get, range(options['warmup'])))
+        started = time.perf_counter()
+        results = list(pool.map(get, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        durations = sorted(duration * 1000 for duration, status in results if status == 200)
+        errors = len(results) - len(durations)
+        if not durations:
+            self.stdout.write(self.style.ERROR(f'{name} {url}: every request failed'))
+            return
+        p50, p95, p99 = (percentile(durations, p) for p in (50, 95, 99))
+        self.stdout.write(
+            f'{name} {url}: {len(results) / elapsed:.0f} req/s, '
+            f'p50 {p50:.1f}ms p95 {p95:.1f}ms p99 {p99:.1f}ms, {errors} errors'
+        )
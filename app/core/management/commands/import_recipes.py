@@ -0,0 +1,167 @@
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from core.bulk import bulk_create_links, bulk_create_with_pks
+from core.models import Ingredient, Recipe, Tag
+from core.signals import bulk_changed
+
+RECIPE_FIELDS = ('title', 'time_minutes', 'price', 'link')
+RELATIONS = (
+    ('tags', Tag, 'tag_id'),
+    ('ingredients', Ingredient, 'ingredient_id'),
+)
+
+
+def read_csv(file, separator):
+    """rows of a csv with a header, tags and ingredients are names joined by separator"""
+    for row in csv.DictReader(file):
+        for field, _, _ in RELATIONS:
+            row[field] = (row.get(field) or '').split(separator)
+        yield row
+
+
+def read_ndjson(file, separator=None):
+    """one json object per line, tags and ingredients are lists of names"""
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+class NameMap:
+    """name to id map of the user's tags or ingredients, creating the missing ones in bulk"""
+
+    def __init__(self, model, user):
+        self.model = model
+        self.user = user
+        self.ids = dict(model.objects.filter(user=user).order_by('-id').values_list('name', 'id'))
+        self.created = 0
+
+    def resolve(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.ids]
+        if missing:
+            objects = bulk_create_with_pks(self.model, [self.model(user=self.user, name=name) for name in missing])
+            self.ids.update((obj.name, obj.pk) for obj in objects)
+            self.created += len(objects)
+            bulk_changed.send(sender=self.model, user_id=self.user.pk, action='create', pks=[obj.pk for obj in objects])
+        return [self.ids[name] for name in names]
+
+
+class Command(BaseCommand):
+    help = 'Imports recipes of one user from a CSV or NDJSON file, streaming it in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file to import, - reads stdin')
+        parser.add_argument('--user', required=True, help='email of the user the recipes are imported for')
+        parser.add_argument('--input-format', choices=sorted(READERS), help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--separator', default='|', help='separates tag and ingredient names in csv cells')
+        parser.add_argument('--no-copy', action='store_true', help='never load link rows with postgres COPY')
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        try:
+            self.user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["user"]}.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        path = options['path']
+        input_format = options['input_format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if input_format not in READERS:
+            raise CommandError('Cannot tell the input format, pass --input-format.')
+
+        self.using = router.db_for_write(Recipe)
+        self.use_copy = not options['no_copy'] and connections[self.using].vendor == 'postgresql'
+        self.names = {field: NameMap(model, self.user) for field, model, _ in RELATIONS}
+        self.imported = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+        file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            rows = READERS[input_format](file, options['separator'])
+            batch = []
+            for number, row in enumerate(rows, start=1):
+                item = self.clean(number, row)
+                if item is None:
+                    continue
+                batch.append(item)
+                if len(batch) == options['batch_size']:
+                    self.load(batch)
+                    batch = []
+            if batch:
+                self.load(batch)
+        except (csv.Error, json.JSONDecodeError) as exc:
+            raise CommandError(f'Cannot parse {path}: {exc}')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'imported {self.imported} recipes, created {self.names["tags"].created} tags and '
+            f'{self.names["ingredients"].created} ingredients, skipped {self.skipped} rows '
+            f'in {self.elapsed():.1f}s ({self.rate():.0f} recipes/s).'
+        ))
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def rate(self):
+        return self.imported / max(self.elapsed(), 1e-9)
+
+    def clean(self, number, row):
+        """validated recipe fields and relation names of a row, None when the row is skipped"""
+        item = {}
+        try:
+            if not isinstance(row, dict):
+                raise ValidationError('Expected an object.')
+            for name in RECIPE_FIELDS:
+                value = row.get(name)
+                item[name] = Recipe._meta.get_field(name).clean('' if value is None else value, None)
+            for field, model, _ in RELATIONS:
+                if not isinstance(row.get(field) or [], list):
+                    raise ValidationError(f'{field} must be a list of names.')
+                names = [str(name).strip() for name in row.get(field) or []]
+                item[field] = [model._meta.get_field('name').clean(name, None) for name in names if name]
+        except ValidationError as exc:
+            self.skipped += 1
+            self.stderr.write(f'row {number} skipped: {"; ".join(exc.messages)}')
+            return None
+        return item
+
+    def load(self, batch):
+        with transaction.atomic(using=self.using):
+            recipes = [
+                Recipe(user=self.user, **{name: item[name] for name in RECIPE_FIELDS})
+                for item in batch
+            ]
+            bulk_create_with_pks(Recipe, recipes, using=self.using)
+            for field, model, column in RELATIONS:
+                ids = self.names[field].resolve([name for item in batch for name in item[field]])
+                rows = []
+                position = 0
+                for recipe, item in zip(recipes, batch):
+                    count = len(item[field])
+                    rows.extend((recipe.pk, pk) for pk in dict.fromkeys(ids[position:position + count]))
+                    position += count
+                bulk_create_links(getattr(Recipe, field).through, column, rows, self.using, self.use_copy)
+            bulk_changed.send(sender=Recipe, user_id=self.user.pk, action='create', pks=[r.pk for r in recipes])
+
+        self.imported += len(batch)
+        self.stdout.write(f'{self.imported} recipes imported ({self.rate():.0f} recipes/s)')
@@ -0,0 +1,203 @@
+import io
+import json
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.benchmarks import summarize
+from core.models import Ingredient, Recipe, Tag
+from core.profiling import RequestRecorder, recording
+
+BULK_ITEMS = 50
+IMAGE_SIZE = (1200, 900)
+
+
+class Benchmark:
+    """
+    the requests of every scenario, made in-process through the whole
+    middleware and view stack as the given user. recipes created by the
+    write scenarios are remembered so they can be deleted afterwards.
+    """
+
+    def __init__(self, user, rng, host):
+        self.user = user
+        self.rng = rng
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client = APIClient(HTTP_HOST=host, HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.recipe_ids = list(Recipe.objects.filter(user=user).values_list('id', flat=True))
+        self.tag_ids = list(Tag.objects.filter(user=user).values_list('id', flat=True))
+        self.ingredient_ids = list(Ingredient.objects.filter(user=user).values_list('id', flat=True))
+        self.created = []
+        self.image = None
+
+    def sample(self, ids, count):
+        return self.rng.sample(ids, min(count, len(ids)))
+
+    def recipe_payload(self, number):
+        return {
+            'title': f'Benchmark recipe {number}',
+            'time_minutes': self.rng.randint(5, 120),
+            'price': f'{self.rng.uniform(1, 50):.2f}',
+            'tags': self.sample(self.tag_ids, 3),
+            'ingredients': self.sample(self.ingredient_ids, 6),
+        }
+
+    # every scenario returns the request to make as (method, path, keyword arguments)
+
+    def scenario_list(self, number):
+        return 'get', reverse('recipe:recipe-list'), {'data': {'page_size': 50}}
+
+    def scenario_filter(self, number):
+        params = {'page_size': 50}
+        if self.tag_ids:
+            params['tags'] = ','.join(str(pk) for pk in self.sample(self.tag_ids, 2))
+        if self.ingredient_ids:
+            params['ingredients'] = str(self.rng.choice(self.ingredient_ids))
+        return 'get', reverse('recipe:recipe-list'), {'data': params}
+
+    def scenario_detail(self, number):
+        return 'get', reverse('recipe:recipe-detail', args=[self.rng.choice(self.recipe_ids)]), {}
+
+    def scenario_create(self, number):
+        return 'post', reverse('recipe:recipe-list'), {'data': self.recipe_payload(number), 'format': 'json'}
+
+    def scenario_bulk(self, number):
+        items = [self.recipe_payload(number * BULK_ITEMS + index) for index in range(BULK_ITEMS)]
+        return 'post', reverse('recipe:recipe-bulk'), {'data': items, 'format': 'json'}
+
+    def scenario_upload(self, number):
+        if self.image is None:
+            self.image = Image.effect_noise(IMAGE_SIZE, 64).convert('RGB')
+            self.upload_recipe = Recipe.objects.create(
+                user=self.user, title='Benchmark upload', time_minutes=1, price=1,
+            )
+            self.created.append(self.upload_recipe.pk)
+        # a different image every time, identical uploads are deduplicated by content hash
+        self.image.putpixel((0, 0), (number % 256, number // 256 % 256, 0))
+        file = io.BytesIO()
+        self.image.save(file, 'JPEG', quality=85)
+        file.seek(0)
+        file.name = f'benchmark-{number}.jpg'
+        url = reverse('recipe:recipe-upload-image', args=[self.upload_recipe.pk])
+        return 'post', url, {'data': {'image': file}, 'format': 'multipart'}
+
+    def run(self, name, requests, warmup):
+        scenario = getattr(self, f'scenario_{name}')
+        durations, queries, errors = [], [], 0
+        elapsed = 0.0
+        for number in range(warmup + requests):
+            method, path, kwargs = scenario(number)
+            recorder = RequestRecorder()
+            started = time.perf_counter()
+            with recording(recorder):
+                response = getattr(self.client, method)(path, **kwargs)
+            duration = time.perf_counter() - started
+            if response.status_code == 201 and name in ('create', 'bulk'):
+                data = response.json()
+                self.created.extend(item['id'] for item in (data if isinstance(data, list) else [data]))
+            if number < warmup:
+                continue
+            elapsed += duration
+            if response.status_code >= 400:
+                errors += 1
+                continue
+            durations.append(duration)
+            queries.append(recorder.queries)
+        return summarize(durations, elapsed, errors, queries)
+
+    def cleanup(self):
+        Recipe.objects.filter(pk__in=self.created).delete()
+
+
+SCENARIOS = [name[len('scenario_'):] for name in dir(Benchmark) if name.startswith('scenario_')]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the recipe API in-process and writes throughput, latency percentiles and query counts as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='email of the user to benchmark as, defaults to the first seeded user')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help=f'defaults to all of {", ".join(SCENARIOS)}')
+        parser.add_argument('--requests', type=int, default=100, help='measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='requests made first and not measured')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='result file, defaults to benchmark-<time>.json')
+        parser.add_argument('--compare', help='an earlier result file to print the changes against')
+        parser.add_argument('--host', help='Host header of the requests, defaults to the first ALLOWED_HOSTS entry')
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        if options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('--requests must be positive and --warmup not negative.')
+        user = self.get_user(options['user'])
+        baseline = self.load(options['compare']) if options['compare'] else None
+
+        benchmark = Benchmark(user, random.Random(options['seed']), options['host'] or self.default_host())
+        if not benchmark.recipe_ids:
+            raise CommandError(f'{user.email} has no recipes, run seed_benchmark first.')
+        results = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'database': connections[router.db_for_read(Recipe)].vendor,
+            'user': user.email,
+            'recipes': len(benchmark.recipe_ids),
+            'tags': len(benchmark.tag_ids),
+            'ingredients': len(benchmark.ingredient_ids),
+            'requests': options['requests'],
+            'settings': {'RECIPE_FAST_LIST': settings.RECIPE_FAST_LIST},
+            'scenarios': {},
+        }
+        try:
+            for name in options['scenarios'] or SCENARIOS:
+                result = benchmark.run(name, options['requests'], options['warmup'])
+                results['scenarios'][name] = result
+                self.stdout.write(self.format(name, result, (baseline or {}).get('scenarios', {}).get(name)))
+        finally:
+            benchmark.cleanup()
+
+        output = options['output'] or f'benchmark-{datetime.now():%Y%m%d-%H%M%S}.json'
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'results written to {output}'))
+
+    def get_user(self, email):
+        users = get_user_model().objects.order_by('id')
+        user = users.filter(email=email).first() if email else users.filter(is_benchmark=True).first()
+        if user is None:
+            raise CommandError(f'No user {email}.' if email else 'No seeded users, run seed_benchmark first.')
+        return user
+
+    def default_host(self):
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*':
+                return host.lstrip('.')
+        return 'localhost'
+
+    def load(self, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+
+    def format(self, name, result, previous):
+        line = (
+            f'{name}: {result["throughput"]} req/s, p50 {result["p50_ms"]}ms p95 {result["p95_ms"]}ms '
+            f'p99 {result["p99_ms"]}ms, {result.get("queries_mean")} queries, {result["errors"]} errors'
+        )
+        if previous:
+            changes = []
+            for key in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms'):
+                if result[key] is not None and previous.get(key):
+                    changes.append(f'{key} {(result[key] - previous[key]) / previous[key] * 100:+.1f}%')
+            line += f' ({", ".join(changes)})'
+        return line
@@ -0,0 +1,166 @@
+import itertools
+import random
+import time
+from decimal import Decimal
+from typing import Any, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from rest_framework.authtoken.models import Token
+
+from core.bulk import bulk_create_links, bulk_create_with_pks, delete_cascade_without_signals
+from core.models import Ingredient, Recipe, Tag
+from core.signals import bulk_changed
+
+PASSWORD = 'benchmark-password'
+
+ADJECTIVES = ('Spicy', 'Creamy', 'Crispy', 'Smoky', 'Quick', 'Rustic', 'Zesty', 'Hearty', 'Sweet', 'Tangy')
+DISHES = ('Curry', 'Soup', 'Salad', 'Stew', 'Pasta', 'Risotto', 'Tacos', 'Pie', 'Noodles', 'Bowl', 'Bake', 'Roast')
+STYLES = ('', 'with Herbs', 'for Two', 'Deluxe', 'Classic', 'Weeknight', 'with Rice', 'Traybake')
+TAG_WORDS = (
+    'Vegan', 'Vegetarian', 'Dinner', 'Lunch', 'Breakfast', 'Dessert', 'Quick', 'Budget', 'Healthy', 'Spicy',
+    'Italian', 'Mexican', 'Indian', 'Thai', 'Japanese', 'Gluten free', 'Dairy free', 'Baking', 'Grill', 'Party',
+)
+INGREDIENT_WORDS = (
+    'Salt', 'Pepper', 'Olive oil', 'Garlic', 'Onion', 'Butter', 'Flour', 'Sugar', 'Egg', 'Milk', 'Rice',
+    'Tomato', 'Chicken', 'Beef', 'Tofu', 'Lentils', 'Basil', 'Cumin', 'Lemon', 'Ginger', 'Chili', 'Cheese',
+    'Potato', 'Carrot', 'Spinach', 'Mushroom', 'Coconut milk', 'Soy sauce', 'Honey', 'Yogurt',
+)
+
+
+def names(words, count):
+    """count distinct names, the plain words first and numbered variants after"""
+    variants = itertools.chain(words, (f'{word} {n}' for n in itertools.count(2) for word in words))
+    return list(itertools.islice(variants, count))
+
+
+def zipf_weights(count):
+    """cumulative weights of a zipf distribution, a few names are used far more often than the rest"""
+    return list(itertools.accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+class RecipeFactory:
+    """realistic recipe field values and relations from a seeded random generator"""
+
+    def __init__(self, rng, tag_ids, ingredient_ids):
+        self.rng = rng
+        self.tag_ids = tag_ids
+        self.ingredient_ids = ingredient_ids
+        self.tag_weights = zipf_weights(len(tag_ids))
+        self.ingredient_weights = zipf_weights(len(ingredient_ids))
+
+    def fields(self, number):
+        rng = self.rng
+        title = ' '.join(filter(None, (rng.choice(ADJECTIVES), rng.choice(DISHES), rng.choice(STYLES))))
+        price = min(Decimal('999.99'), Decimal(str(round(rng.lognormvariate(2.3, 0.6), 2))))
+        return {
+            'title': title,
+            # most recipes take 20 to 60 minutes, with a long tail
+            'time_minutes': max(1, min(600, int(rng.lognormvariate(3.4, 0.6)))),
+            'price': price,
+            'link': f'https://example.com/recipes/{number}' if rng.random() < 0.3 else '',
+        }
+
+    def related(self, ids, weights, low, high):
+        if not ids:
+            return []
+        count = self.rng.randint(low, high)
+        return list(dict.fromkeys(self.rng.choices(ids, cum_weights=weights, k=count)))
+
+    def tags(self):
+        return self.related(self.tag_ids, self.tag_weights, 0, 4)
+
+    def ingredients(self):
+        return self.related(self.ingredient_ids, self.ingredient_weights, 3, 12)
+
+
+class Command(BaseCommand):
+    help = 'Generates users with recipes, tags and ingredients to benchmark against, repeatable by --seed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--recipes', type=int, default=1000, help='recipes in total, spread over the users')
+        parser.add_argument('--tags', type=int, default=50, help='tags per user')
+        parser.add_argument('--ingredients', type=int, default=200, help='ingredients per user')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--email-prefix', default='bench', help='users are <prefix><n>@example.com')
+        parser.add_argument('--clear', action='store_true', help='delete the users seeded before first')
+        parser.add_argument('--no-copy', action='store_true', help='never load link rows with postgres COPY')
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        for name in ('users', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be positive.')
+        for name in ('recipes', 'tags', 'ingredients'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} must not be negative.')
+
+        self.using = router.db_for_write(Recipe)
+        users = get_user_model().objects.filter(is_benchmark=True)
+        if users.exists():
+            if not options['clear']:
+                raise CommandError('Benchmark users exist already, pass --clear to replace them.')
+            self.clear(users)
+        emails = [f'{options["email_prefix"]}{index}@example.com' for index in range(options['users'])]
+        if get_user_model().objects.filter(email__in=emails).exists():
+            raise CommandError('Users with the benchmark emails exist already, pass another --email-prefix.')
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.seeded = 0
+        self.started = time.monotonic()
+
+        per_user, extra = divmod(options['recipes'], options['users'])
+        for index, email in enumerate(emails):
+            user = get_user_model().objects.create_user(email, PASSWORD, is_benchmark=True)
+            Token.objects.create(user=user)
+            self.seed_user(user, per_user + (index < extra))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'seeded {options["users"]} users and {self.seeded} recipes in '
+            f'{time.monotonic() - self.started:.1f}s ({self.rate():.0f} recipes/s).'
+        ))
+
+    def clear(self, users):
+        """
+        deletes the seeded users and everything of theirs a table at a time.
+        the per object delete signals would cost queries per recipe, their
+        summaries, versions and change logs are rows of the users and go too.
+        """
+        with transaction.atomic(using=self.using):
+            deleted = delete_cascade_without_signals(users.using(self.using))
+        self.stdout.write(f'deleted {deleted} benchmark users')
+
+    def rate(self):
+        return self.seeded / max(time.monotonic() - self.started, 1e-9)
+
+    def seed_user(self, user, count):
+        tag_ids = self.create_attrs(Tag, user, names(TAG_WORDS, self.options['tags']))
+        ingredient_ids = self.create_attrs(Ingredient, user, names(INGREDIENT_WORDS, self.options['ingredients']))
+        factory = RecipeFactory(self.rng, tag_ids, ingredient_ids)
+        for start in range(0, count, self.options['batch_size']):
+            size = min(self.options['batch_size'], count - start)
+            self.load(user, factory, range(self.seeded + 1, self.seeded + 1 + size))
+
+    def create_attrs(self, model, user, attr_names):
+        objects = bulk_create_with_pks(model, [model(user=user, name=name) for name in attr_names], using=self.using)
+        pks = [obj.pk for obj in objects]
+        bulk_changed.send(sender=model, user_id=user.pk, action='create', pks=pks)
+        return pks
+
+    def load(self, user, factory, numbers):
+        with transaction.atomic(using=self.using):
+            recipes = bulk_create_with_pks(
+                Recipe, [Recipe(user=user, **factory.fields(number)) for number in numbers], using=self.using,
+            )
+            tags = [(recipe.pk, pk) for recipe in recipes for pk in factory.tags()]
+            ingredients = [(recipe.pk, pk) for recipe in recipes for pk in factory.ingredients()]
+            use_copy = not self.options['no_copy']
+            bulk_create_links(Recipe.tags.through, 'tag_id', tags, self.using, use_copy)
+            bulk_create_links(Recipe.ingredients.through, 'ingredient_id', ingredients, self.using, use_copy)
+            bulk_changed.send(sender=Recipe, user_id=user.pk, action='create', pks=[recipe.pk for recipe in recipes])
+
+        self.seeded += len(recipes)
+        self.stdout.write(f'{self.seeded} recipes seeded ({self.rate():.0f} recipes/s)')
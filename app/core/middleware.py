@@ -0,0 +1,183 @@
+import cProfile
+import hashlib
+import logging
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+
+from core.db.routers import current_replica, enable_replica_reads, replica_reads, reset_replica_reads
+from core.profiling import RequestRecorder, instrument_serializers, recording, registry
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def view_action(view_func, method):
+    """the viewset action a DRF view runs for method, the handler name for other DRF views"""
+    method = method.lower()
+    actions = getattr(view_func, 'actions', None)
+    if actions is None:
+        return method
+    if method == 'head' and 'head' not in actions:
+        method = 'get'
+    return actions.get(method)
+
+
+def endpoint_name(view_func, method):
+    """ViewSet.action or View.handler for DRF views, the dotted path of other views"""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    return f'{cls.__name__}.{view_action(view_func, method)}'
+
+
+def _sticky_key(request):
+    credentials = request.META.get('HTTP_AUTHORIZATION')
+    if not credentials:
+        return None
+    return f'db:primary:{hashlib.sha1(credentials.encode()).hexdigest()}'
+
+
+def _with_replica_reads(content, replica):
+    """
+    a streamed body is produced after the middleware returned, each chunk is
+    read from the replica the rest of the request used
+    """
+    iterator = iter(content)
+    while True:
+        with replica_reads(replica):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    """
+    enables replica reads for safe requests to the actions a view lists in
+    replica_actions, for the whole request including rendering. a client
+    that wrote stays on the primary for DATABASE_REPLICA_STICKY_SECONDS, so
+    it reads its own writes whatever the replication lag. clients are told
+    apart by their credentials, kept in DATABASE_REPLICA_CACHE_ALIAS which
+    every worker shares. all reads of a request go to one replica, see
+    core.db.routers. not loaded when no DATABASE_REPLICAS are configured.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.cache = caches[settings.DATABASE_REPLICA_CACHE_ALIAS]
+
+    def __call__(self, request):
+        token = enable_replica_reads(False)
+        try:
+            response = self.get_response(request)
+            replica = current_replica()
+            if response.streaming and replica is not None:
+                response.streaming_content = _with_replica_reads(response.streaming_content, replica)
+        finally:
+            reset_replica_reads(token)
+        if request.method not in SAFE_METHODS:
+            key = _sticky_key(request)
+            if key is not None:
+                self.cache.set(key, True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in SAFE_METHODS:
+            return None
+        replica_actions = getattr(getattr(view_func, 'cls', None), 'replica_actions', ())
+        if view_action(view_func, request.method) not in replica_actions:
+            return None
+        key = _sticky_key(request)
+        if key is not None and self.cache.get(key):
+            return None
+        enable_replica_reads()
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    records per endpoint the requests, wall time, database queries and their
+    time, serialization time, render time and response bytes, served in prometheus format by
+    core.views.MetricsView. requests running one statement
+    PROFILING_DUPLICATE_QUERIES times or more are counted and logged as N+1
+    suspects. a PROFILING_SAMPLE_RATE share of requests runs under cProfile,
+    dumped to PROFILING_DUMP_DIR. not loaded unless PROFILING is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        instrument_serializers()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = RequestRecorder()
+        request._profiling_recorder = recorder
+        profiler = self._profiler()
+        started = time.perf_counter()
+        with recording(recorder):
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        wall_seconds = time.perf_counter() - started
+
+        endpoint = recorder.endpoint or 'unresolved'
+        duplicates = recorder.duplicates(settings.PROFILING_DUPLICATE_QUERIES)
+        for sql, count in duplicates:
+            logger.warning('%s ran a statement %d times, possible N+1: %s', endpoint, count, sql)
+        if response.streaming:
+            response.streaming_content = self._count_bytes(endpoint, response.streaming_content)
+            response_bytes = 0
+        else:
+            response_bytes = len(response.content)
+        registry.record(endpoint, wall_seconds, recorder, response_bytes, bool(duplicates))
+        if profiler is not None:
+            self._dump(profiler, endpoint)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profiling_recorder.endpoint = endpoint_name(view_func, request.method)
+        return None
+
+    def process_template_response(self, request, response):
+        # the last hook before the response is rendered
+        recorder = request._profiling_recorder
+        started = time.perf_counter()
+
+        def rendered(response):
+            recorder.render_seconds += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def _profiler(self):
+        if not settings.PROFILING_DUMP_DIR or random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return None
+        return cProfile.Profile()
+
+    def _dump(self, profiler, endpoint):
+        os.makedirs(settings.PROFILING_DUMP_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILING_DUMP_DIR, f'{endpoint}-{time.time_ns()}.prof')
+        profiler.dump_stats(path)
+
+    def _count_bytes(self, endpoint, content):
+        sent = 0
+        try:
+            for chunk in content:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            registry.add_bytes(endpoint, sent)
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """trigram indexes back fuzzy autocomplete, other backends fall back to LIKE"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+    schema_editor.execute('CREATE INDEX core_tag_name_trgm_idx ON core_tag USING gin (name gin_trgm_ops);')
+    schema_editor.execute('CREATE INDEX core_ingredient_name_trgm_idx ON core_ingredient USING gin (name gin_trgm_ops);')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX core_tag_name_trgm_idx;')
+    schema_editor.execute('DROP INDEX core_ingredient_name_trgm_idx;')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
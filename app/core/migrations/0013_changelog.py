@@ -0,0 +1,46 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def seed_changelog(apps, schema_editor):
+    """existing objects get an upsert entry, so syncing from cursor 0 sees the whole collection"""
+    ChangeLogEntry = apps.get_model('core', 'ChangeLogEntry')
+    for model_name in ('tag', 'ingredient', 'recipe'):
+        model = apps.get_model('core', model_name)
+        rows = model.objects.order_by('id').values_list('id', 'user_id').iterator(chunk_size=2000)
+        batch = []
+        for object_id, user_id in rows:
+            batch.append(ChangeLogEntry(user_id=user_id, model=model_name, object_id=object_id, action='upsert'))
+            if len(batch) == 2000:
+                ChangeLogEntry.objects.bulk_create(batch)
+                batch = []
+        ChangeLogEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_updated_at_and_collection_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=8)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['user', 'id'], name='core_changelog_user_id_idx'),
+        ),
+        migrations.RunPython(seed_changelog, migrations.RunPython.noop),
+    ]
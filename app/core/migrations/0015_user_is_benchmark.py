@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_recipe_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='is_benchmark',
+            field=models.BooleanField(default=False),
+        ),
+    ]
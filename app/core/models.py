@@ -1,15 +1,19 @@
 import uuid
 import os
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import (
     AbstractBaseUser, BaseUserManager, PermissionsMixin
 )
 from django.conf import settings
+from django.utils import timezone
 
 
 def recipe_image_file_path(instance, original_file_name):
-    extension = original_file_name.split('.')[-1]
-    filename = f'{uuid.uuid4()}.{extension}'
+    """names images by content hash when it is known, so identical uploads share a file"""
+    extension = original_file_name.split('.')[-1].lower()
+    stem = getattr(instance, 'image_hash', None) or uuid.uuid4()
+    filename = f'{stem}.{extension}'
     return os.path.join('uploads/recipe/', filename)
 
 
@@ -30,6 +34,13 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def lock(self, user_id):
+        """
+        locks the row of the user until the transaction ends, serializing the
+        writers of per user data. a user being deleted has no row to lock.
+        """
+        list(self.select_for_update().filter(pk=user_id).values_list('pk', flat=True))
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     """customer User model that supports <email> instead of <username>"""
@@ -37,6 +48,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # created by the seed_benchmark command, which deletes only these
+    is_benchmark = models.BooleanField(default=False)
 
     objects = UserManager()
 
@@ -46,6 +59,12 @@ class User(AbstractBaseUser, PermissionsMixin):
 class Tag(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-name', 'id'], name='core_tag_user_name_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -54,11 +73,34 @@ class Tag(models.Model):
 class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-name', 'id'], name='core_ingredient_user_name_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related_ids(self):
+        """prefetches only the ids of tags and ingredients"""
+        return self.prefetch_related(
+            models.Prefetch('tags', queryset=Tag.objects.only('id').order_by('id')),
+            models.Prefetch('ingredients', queryset=Ingredient.objects.only('id').order_by('id')),
+        )
+
+    def with_related_objects(self):
+        """prefetches full tag and ingredient objects for nested output"""
+        return self.prefetch_related(
+            models.Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            models.Prefetch('ingredients', queryset=Ingredient.objects.order_by('id')),
+        )
+
+
 class Recipe(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
@@ -68,6 +110,121 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    image_variants = models.JSONField(default=dict, blank=True)
+    # title, tag and ingredient names, kept up to date by recipe.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+    # also moved forward when tags or ingredients are linked, renamed or deleted
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.title
+
+
+class CollectionVersionManager(models.Manager):
+
+    def current(self, user_id):
+        """returns the version row of the user, creating it on first use"""
+        version, _ = self.get_or_create(user_id=user_id)
+        return version
+
+    def bump(self, user_id):
+        """
+        moves the version forward. users without a row have never been handed
+        a version, so there is nothing to invalidate and no row is created,
+        which also keeps this safe while the user is being deleted.
+        """
+        self.filter(user_id=user_id).update(version=models.F('version') + 1, updated_at=timezone.now())
+
+
+class CollectionVersion(models.Model):
+    """counter that moves whenever any recipe, tag or ingredient of the user changes"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CollectionVersionManager()
+
+    def __str__(self) -> str:
+        return f'{self.user_id}@{self.version}'
+
+
+class ChangeLogEntry(models.Model):
+    """one row per change of a recipe, tag or ingredient, ids give sync clients a monotonic cursor"""
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTION_CHOICES = (
+        (UPSERT, 'Upsert'),
+        (DELETE, 'Delete'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    # model_name of the changed object
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='core_changelog_user_id_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.action} {self.model} {self.object_id}'
+
+
+class RecipeStats(models.Model):
+    """running totals over the recipes of a user, kept up to date by recipe.stats"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    recipe_count = models.IntegerField(default=0)
+    time_minutes_sum = models.BigIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f'{self.user_id}: {self.recipe_count} recipes'
+
+
+class RecipeValueCount(models.Model):
+    """how many recipes of a user have a value in a field, the histogram percentiles are read from"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    field = models.CharField(max_length=32)
+    value = models.DecimalField(max_digits=12, decimal_places=2)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'field', 'value'], name='core_recipevaluecount_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.field}={self.value}: {self.count}'
+
+
+class AttrUsage(models.Model):
+    """how many recipes of a user use one of their tags or ingredients"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
+    # model_name of the tag or ingredient
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'model', 'object_id'], name='core_attrusage_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'model', '-count', 'object_id'], name='core_attrusage_top_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.model} {self.object_id}: {self.count}'
@@ -0,0 +1,211 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from rest_framework import serializers
+
+# upper bounds of the request duration histogram, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_recorder = ContextVar('profiling_recorder', default=None)
+# set while the outermost serializer .data of a request is being computed
+_serializing = ContextVar('profiling_serializing', default=False)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def normalize(sql):
+    """the statement with IN lists collapsed, so batches of any size count as one pattern"""
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+class RequestRecorder:
+    """execute wrapper counting and timing the queries of one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = Counter()
+        self.endpoint = None
+        self.render_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.queries += 1
+                self.sql_seconds += elapsed
+                self.statements[normalize(sql)] += 1
+
+    def add_serialize_seconds(self, seconds):
+        with self._lock:
+            self.serialize_seconds += seconds
+
+    def duplicates(self, threshold):
+        """[(statement, count)] of the statements run threshold times or more, the N+1 pattern"""
+        with self._lock:
+            return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+@contextmanager
+def _wrap_connections(recorder):
+    with ExitStack() as stack:
+        for alias in connections:
+            connection = connections[alias]
+            # the async views may hand work to the very thread already recording
+            if recorder not in connection.execute_wrappers:
+                stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+@contextmanager
+def recording(recorder):
+    """records the queries of the current thread, and of threads using instrument_thread(), into recorder"""
+    token = _recorder.set(recorder)
+    try:
+        with _wrap_connections(recorder):
+            yield
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def instrument_thread():
+    """records the queries of this thread for the request being recorded, for work handed to other threads"""
+    recorder = _recorder.get()
+    if recorder is None:
+        yield
+        return
+    with _wrap_connections(recorder):
+        yield
+
+
+def _timed_data(getter):
+    def data(self):
+        recorder = _recorder.get()
+        if recorder is None or _serializing.get():
+            return getter(self)
+        token = _serializing.set(True)
+        started = time.perf_counter()
+        try:
+            return getter(self)
+        finally:
+            recorder.add_serialize_seconds(time.perf_counter() - started)
+            _serializing.reset(token)
+    data._profiled = True
+    return property(data)
+
+
+def instrument_serializers():
+    """
+    times serializer .data while a request is recorded. only the outermost
+    call counts, and queries the serializer triggers are part of the time.
+    """
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, '_profiled', False):
+            cls.data = _timed_data(cls.data.fget)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.wall_seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.response_bytes = 0
+        self.duplicate_query_requests = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class ProfileRegistry:
+    """thread safe per endpoint totals of the recorded requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, wall_seconds, recorder, response_bytes, duplicated):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, EndpointStats())
+            stats.requests += 1
+            stats.wall_seconds += wall_seconds
+            stats.queries += recorder.queries
+            stats.sql_seconds += recorder.sql_seconds
+            stats.render_seconds += recorder.render_seconds
+            stats.serialize_seconds += recorder.serialize_seconds
+            stats.response_bytes += response_bytes
+            stats.duplicate_query_requests += duplicated
+            for index, bound in enumerate(BUCKETS):
+                if wall_seconds <= bound:
+                    stats.buckets[index] += 1
+
+    def add_bytes(self, endpoint, response_bytes):
+        """bytes of a streamed response, counted once the stream has been sent"""
+        with self._lock:
+            self._endpoints.setdefault(endpoint, EndpointStats()).response_bytes += response_bytes
+
+    def get(self, endpoint):
+        with self._lock:
+            return self._endpoints.get(endpoint)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def render_prometheus(self, databases=None):
+        """the totals in the prometheus text exposition format, databases as returned by metrics()"""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+            counters = (
+                ('requests_total', 'requests', 'Requests handled.'),
+                ('db_queries_total', 'queries', 'Database queries run.'),
+                ('db_query_seconds_total', 'sql_seconds', 'Time spent in database queries.'),
+                ('serialize_seconds_total', 'serialize_seconds', 'Time spent serializing objects into response data.'),
+                ('render_seconds_total', 'render_seconds', 'Time spent rendering response bodies.'),
+                ('response_bytes_total', 'response_bytes', 'Response body bytes sent.'),
+                ('duplicate_query_requests_total', 'duplicate_query_requests',
+                 'Requests running one statement repeatedly, the N+1 pattern.'),
+            )
+            for name, attribute, description in counters:
+                lines += [f'# HELP recipe_api_{name} {description}', f'# TYPE recipe_api_{name} counter']
+                for endpoint, stats in endpoints:
+                    lines.append(f'recipe_api_{name}{{endpoint="{_escape(endpoint)}"}} {getattr(stats, attribute)}')
+
+            name = 'recipe_api_request_duration_seconds'
+            lines += [f'# HELP {name} Wall time of requests.', f'# TYPE {name} histogram']
+            for endpoint, stats in endpoints:
+                label = f'endpoint="{_escape(endpoint)}"'
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                lines += [
+                    f'{name}_bucket{{{label},le="+Inf"}} {stats.requests}',
+                    f'{name}_sum{{{label}}} {stats.wall_seconds}',
+                    f'{name}_count{{{label}}} {stats.requests}',
+                ]
+
+        for alias, metrics in sorted((databases or {}).items()):
+            label = f'alias="{_escape(alias)}"'
+            if 'connections_opened' in metrics:
+                lines.append(f'recipe_api_db_connections_opened_total{{{label}}} {metrics["connections_opened"]}')
+            for key, value in sorted((metrics.get('pool') or {}).items()):
+                lines.append(f'recipe_api_db_pool_{key}{{{label}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = ProfileRegistry()
@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # datetimes, dates and times go through the DRF encoder, which shortens
+    # microseconds and writes utc as Z, so output matches the stdlib path
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def _default(encoder):
+    """the DRF encoder's default, with Decimals, the most common case in recipe payloads, encoded first"""
+    fallback = encoder.default
+
+    def default(obj):
+        if type(obj) is Decimal:
+            return float(obj)
+        return fallback(obj)
+    return default
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    renders with orjson when it is installed. everything orjson does not
+    encode natively goes through the DRF encoder, and anything it refuses,
+    like integers over 64 bits, is rendered by the stdlib renderer.
+    indented and ascii-only output always uses the stdlib renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default(self.encoder_class()), option=ORJSON_OPTIONS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # keep the output a strict javascript subset, like the stdlib renderer
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    """prometheus text exposition format, the view hands over the finished text"""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        # errors, like a missing token
+        return '\n'.join(f'# {key}: {value}' for key, value in data.items()).encode(self.charset) + b'\n'
@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_token, invalidate_user
+
+# sent after objects of sender were written with bulk_create or bulk_update,
+# or deleted without the collector, which bypass post_save, post_delete and
+# m2m_changed. receives user_id, action ('create', 'update' or 'delete') and
+# pks. deletes of tags or ingredients also pass recipe_ids, the recipes that
+# lost one of them.
+bulk_changed = Signal()
+
+# sent inside the transaction before objects of sender are deleted without the
+# collector, while their rows and links can still be read. receives user_id
+# and pks.
+bulk_deleting = Signal()
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
@@ -1,8 +1,20 @@
+import json
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models.signals import post_delete
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import LiveServerTestCase, TestCase
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, RecipeStats, Tag
+from recipe import stats
+from recipe.async_views import shutdown_executor
 
 
 class CommandTests(TestCase):
@@ -19,3 +31,193 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+
+class ImportRecipesTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+
+    def _write(self, suffix, content):
+        file = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        with file:
+            file.write(content)
+        self.addCleanup(os.unlink, file.name)
+        return file.name
+
+    def _import(self, path, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_recipes', path, '--user', self.user.email, *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_csv(self):
+        path = self._write('.csv', (
+            'title,time_minutes,price,link,tags,ingredients\n'
+            'Curry,30,7.50,,Vegan|Dinner,Rice|Curry paste\n'
+            'Porridge,5,1.20,https://example.com,Breakfast|Vegan,Oats\n'
+        ))
+        stdout, _ = self._import(path, '--batch-size', '1')
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([recipe.title for recipe in recipes], ['Curry', 'Porridge'])
+        self.assertEqual(recipes[1].link, 'https://example.com')
+        self.assertEqual(sorted(recipes[0].tags.values_list('name', flat=True)), ['Dinner', 'Vegan'])
+        self.assertEqual(sorted(recipes[0].ingredients.values_list('name', flat=True)), ['Curry paste', 'Rice'])
+        # existing tags are reused and new names are only created once
+        self.assertEqual(Tag.objects.filter(user=self.user, name='Vegan').get(), self.tag)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+        self.assertIn('imported 2 recipes', stdout)
+
+    def test_import_ndjson_skips_invalid_rows(self):
+        path = self._write('.ndjson', '\n'.join([
+            json.dumps({'title': 'Salad', 'time_minutes': 10, 'price': '3.00', 'tags': ['Vegan']}),
+            json.dumps({'title': 'No time', 'price': '3.00'}),
+            '',
+            json.dumps({'title': 'Too expensive', 'time_minutes': 10, 'price': '123456.00'}),
+        ]))
+        stdout, stderr = self._import(path)
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'Salad')
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertIn('row 2 skipped', stderr)
+        self.assertIn('row 3 skipped', stderr)
+        self.assertIn('skipped 2 rows', stdout)
+
+    def test_import_unknown_user(self):
+        path = self._write('.csv', 'title,time_minutes,price\n')
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', path, '--user', 'nobody@gmail.com')
+
+
+class CompareReadPathsTests(LiveServerTestCase):
+    def setUp(self):
+        self.addCleanup(shutdown_executor)
+
+    def test_reports_both_paths(self):
+        user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        Tag.objects.create(user=user, name='Vegan')
+        token = Token.objects.create(user=user)
+        out = StringIO()
+
+        call_command(
+            'compare_read_paths', '--token', token.key, '--endpoint', 'tags/',
+            '--wsgi-url', f'{self.live_server_url}/api/recipe/',
+            '--asgi-url', f'{self.live_server_url}/api/async/recipe/',
+            '--requests', '10', '--concurrency', '2', '--warmup', '1',
+            stdout=out,
+        )
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ['wsgi', 'asgi'])
+        for line in lines:
+            self.assertIn('p99', line)
+            self.assertTrue(line.endswith(', 0 errors'))
+
+    def test_invalid_token_reported(self):
+        out = StringIO()
+        call_command(
+            'compare_read_paths', '--token', 'invalid', '--endpoint', 'tags/',
+            '--wsgi-url', f'{self.live_server_url}/api/recipe/',
+            '--asgi-url', f'{self.live_server_url}/api/async/recipe/',
+            '--requests', '2', '--warmup', '0', stdout=out,
+        )
+        self.assertEqual(out.getvalue().count('every request failed'), 2)
+
+
+class SeedBenchmarkTests(TestCase):
+
+    def _seed(self, *args):
+        call_command('seed_benchmark', '--users', '2', '--recipes', '7', '--tags', '5', '--ingredients', '12',
+                     '--batch-size', '3', *args, stdout=StringIO())
+        return list(Recipe.objects.order_by('id').values_list('title', 'time_minutes', 'price'))
+
+    def test_seeds_users_and_recipes(self):
+        self._seed()
+
+        users = get_user_model().objects.filter(email__startswith='bench')
+        self.assertEqual(users.count(), 2)
+        self.assertEqual(Token.objects.filter(user__in=users).count(), 2)
+        self.assertEqual(Recipe.objects.filter(user=users.get(email='bench0@example.com')).count(), 4)
+        self.assertEqual(Tag.objects.count(), 10)
+        self.assertEqual(Recipe.objects.filter(ingredients__isnull=True).count(), 0)
+
+    def test_same_seed_repeats_data(self):
+        first = self._seed('--seed', '3')
+        self.assertEqual(self._seed('--seed', '3', '--clear'), first)
+        self.assertEqual(Recipe.objects.count(), 7)
+
+    def test_refuses_to_seed_twice_without_clear(self):
+        self._seed()
+        with self.assertRaises(CommandError):
+            self._seed()
+
+    def test_clear_deletes_only_seeded_users(self):
+        real = get_user_model().objects.create_user('benchmark.fan@example.com', 'testpass12345')
+        Recipe.objects.create(user=real, title='Soup', time_minutes=10, price=5).tags.add(
+            Tag.objects.create(user=real, name='Vegan'),
+        )
+        self._seed()
+        seeded = get_user_model().objects.get(email='bench0@example.com')
+        self.assertTrue(stats.summary(seeded.id)['recipes'])
+
+        deleted = []
+        post_delete.connect(deleted.append, dispatch_uid='test_clear')
+        self.addCleanup(post_delete.disconnect, dispatch_uid='test_clear')
+        self._seed('--clear', '--recipes', '0')
+        self.assertEqual(deleted, [])
+        self.assertEqual(list(Recipe.objects.values_list('title', flat=True)), ['Soup'])
+        self.assertEqual(Tag.objects.exclude(user__is_benchmark=True).count(), 1)
+        self.assertFalse(RecipeStats.objects.exclude(user=real).exists())
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+
+    def test_refuses_to_take_over_existing_emails(self):
+        get_user_model().objects.create_user('bench0@example.com', 'testpass12345')
+        with self.assertRaises(CommandError):
+            self._seed()
+
+
+class RunBenchmarkTests(TestCase):
+
+    def setUp(self):
+        call_command('seed_benchmark', '--users', '1', '--recipes', '20', '--tags', '5', '--ingredients', '10',
+                     stdout=StringIO())
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = os.path.join(self.directory.name, 'result.json')
+
+    def _run(self, *args):
+        stdout = StringIO()
+        call_command('run_benchmark', '--host', 'testserver', '--requests', '3', '--warmup', '1',
+                     '--output', self.output, *args, stdout=stdout)
+        with open(self.output) as file:
+            return json.load(file), stdout.getvalue()
+
+    def test_runs_every_scenario(self):
+        with self.settings(MEDIA_ROOT=self.directory.name, RECIPE_IMAGE_PROCESSING='sync'):
+            result, _ = self._run()
+
+        self.assertEqual(result['recipes'], 20)
+        self.assertEqual(set(result['scenarios']), {'list', 'filter', 'detail', 'create', 'bulk', 'upload'})
+        for name, scenario in result['scenarios'].items():
+            self.assertEqual(scenario['errors'], 0, name)
+            self.assertEqual(scenario['requests'], 3)
+            self.assertGreater(scenario['queries_mean'], 0)
+            self.assertLessEqual(scenario['p50_ms'], scenario['p99_ms'])
+        # the recipes the write scenarios created are removed again
+        self.assertEqual(Recipe.objects.count(), 20)
+
+    def test_compares_with_previous_result(self):
+        self._run('--scenario', 'detail')
+        previous = os.path.join(self.directory.name, 'previous.json')
+        os.rename(self.output, previous)
+
+        _, output = self._run('--scenario', 'detail', '--compare', previous)
+
+        self.assertIn('detail:', output)
+        self.assertIn('p95_ms', output)
+
+    def test_requires_seeded_user(self):
+        with self.assertRaises(CommandError):
+            call_command('run_benchmark', '--user', 'nobody@example.com', stdout=StringIO())
@@ -0,0 +1,313 @@
+import threading
+import unittest
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.checks import check_replica_cache
+from core.db.postgresql.base import DatabaseWrapper, close_pools
+from core.db.pool import ConnectionPool, PoolTimeout
+from core.db.routers import ReplicaRouter, replica_reads, replica_reads_enabled
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Recipe
+from recipe.views import RecipeViewSet
+from user.views import ManageUserView
+
+
+DB_METRICS_URL = reverse('core:db-metrics')
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+STATS_URL = reverse('recipe:recipe-stats')
+
+# a second connection to the test database standing in for a replica, the
+# test runner sets it up as a mirror of default
+REPLICA = 'replica_test'
+connections.settings.setdefault(REPLICA, {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}})
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def test_reuses_released_connections(self):
+        pool = ConnectionPool(max_size=2)
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+        self.assertIs(pool.acquire(FakeConnection), first)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['checkouts'], stats['in_use']), (1, 2, 1))
+
+    def test_times_out_when_exhausted(self):
+        pool = ConnectionPool(max_size=1, timeout=0.01)
+        pool.acquire(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waits_for_a_release(self):
+        pool = ConnectionPool(max_size=1, timeout=5)
+        first = pool.acquire(FakeConnection)
+        threading.Timer(0.05, pool.release, (first, )).start()
+        self.assertIs(pool.acquire(FakeConnection), first)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_discards_connections_failing_checks(self):
+        pool = ConnectionPool(max_size=1, check=lambda conn: False, reset=lambda conn: not conn.closed)
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+        second = pool.acquire(FakeConnection)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+
+        second.close()
+        pool.release(second)
+        self.assertEqual(pool.stats()['discarded'], 2)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_discards_expired_connections(self):
+        pool = ConnectionPool(max_size=1, max_lifetime=0)
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool(max_size=1, timeout=0.01)
+
+        def fail():
+            raise OSError('refused')
+
+        with self.assertRaises(OSError):
+            pool.acquire(fail)
+        self.assertIsInstance(pool.acquire(FakeConnection), FakeConnection)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_from_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_reads_from_replica_when_enabled(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Recipe), 'default')
+        self.assertFalse(replica_reads_enabled())
+
+    @override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'])
+    def test_one_replica_per_context(self):
+        with replica_reads():
+            self.assertEqual(len({self.router.db_for_read(Recipe) for _ in range(20)}), 1)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_reads_from_primary_without_replicas(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_reads_of_other_apps_from_primary(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Token), 'default')
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica_0', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingMiddlewareTests(SimpleTestCase):
+
+    def _enabled_for(self, request, view):
+        enabled = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            enabled.append(replica_reads_enabled())
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        middleware(request)
+        self.assertFalse(replica_reads_enabled())
+        return enabled[0]
+
+    def test_enabled_for_replica_actions(self):
+        view = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+        self.assertTrue(self._enabled_for(RequestFactory().get('/'), view))
+        self.assertTrue(self._enabled_for(RequestFactory().head('/'), view))
+        self.assertFalse(self._enabled_for(RequestFactory().post('/'), view))
+
+    def test_disabled_for_other_actions(self):
+        view = RecipeViewSet.as_view({'get': 'stats'})
+        self.assertFalse(self._enabled_for(RequestFactory().get('/'), view))
+
+    def test_enabled_for_api_view_handlers(self):
+        view = ManageUserView.as_view()
+        self.assertTrue(self._enabled_for(RequestFactory().get('/'), view))
+        self.assertFalse(self._enabled_for(RequestFactory().patch('/'), view))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_not_used_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(lambda request: None)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], DATABASE_REPLICA_STICKY_SECONDS=60)
+class ReplicaReadsTests(TransactionTestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        caches[settings.DATABASE_REPLICA_CACHE_ALIAS].clear()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.recipe = Recipe.objects.create(user=self.user, title='Soup', time_minutes=10, price=5)
+        self.client = self._client(self.user)
+
+    def _client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return client
+
+    def _replica_queries(self, client, method, url, data=None):
+        with CaptureQueriesContext(connections[REPLICA]) as queries:
+            response = getattr(client, method)(url, data)
+        self.assertLess(response.status_code, 300)
+        return len(queries)
+
+    def test_reads_from_replica(self):
+        for url in (RECIPES_URL, reverse('recipe:recipe-detail', args=[self.recipe.id]), TAGS_URL, INGREDIENTS_URL):
+            self.assertGreater(self._replica_queries(self.client, 'get', url), 0, url)
+
+    def test_list_version_read_from_replica(self):
+        # no version row yet, the replica is asked once and the primary serves the list
+        self.assertEqual(self._replica_queries(self.client, 'get', RECIPES_URL), 1)
+        with CaptureQueriesContext(connections[REPLICA]) as queries:
+            response = self.client.get(RECIPES_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('core_collectionversion', queries[0]['sql'])
+        self.assertGreater(len(queries), 1)
+
+    def test_streams_export_from_replica(self):
+        response = self.client.get(reverse('recipe:recipe-export'))
+        with CaptureQueriesContext(connections[REPLICA]) as queries:
+            content = b''.join(response.streaming_content)
+        self.assertIn(b'Soup', content)
+        self.assertGreater(len(queries), 0)
+        self.assertFalse(replica_reads_enabled())
+
+    def test_writes_and_stats_on_primary(self):
+        self.assertEqual(self._replica_queries(self.client, 'get', STATS_URL), 0)
+        self.assertEqual(self._replica_queries(self.client, 'post', TAGS_URL, {'name': 'Vegan'}), 0)
+
+    def test_reads_own_writes_from_primary(self):
+        self._replica_queries(self.client, 'post', TAGS_URL, {'name': 'Vegan'})
+        self.assertEqual(self._replica_queries(self.client, 'get', RECIPES_URL), 0)
+
+        other = self._client(get_user_model().objects.create_user('other@gmail.com', 'testpass12345'))
+        self.assertGreater(self._replica_queries(other, 'get', RECIPES_URL), 0)
+
+    def test_back_on_replica_after_window(self):
+        with override_settings(DATABASE_REPLICA_STICKY_SECONDS=0):
+            self._replica_queries(self.client, 'post', TAGS_URL, {'name': 'Vegan'})
+        self.assertGreater(self._replica_queries(self.client, 'get', RECIPES_URL), 0)
+
+
+class ReplicaCacheCheckTests(SimpleTestCase):
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_process_local_cache_rejected(self):
+        self.assertEqual([error.id for error in check_replica_cache(None)], ['core.E001'])
+
+    @override_settings(
+        DATABASE_REPLICAS=['replica_0'],
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}},
+    )
+    def test_shared_cache_accepted(self):
+        self.assertEqual(check_replica_cache(None), [])
+
+    def test_not_checked_without_replicas(self):
+        self.assertEqual(check_replica_cache(None), [])
+
+
+class DatabaseMetricsApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_admin_required(self):
+        user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(user)
+        response = self.client.get(DB_METRICS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_lists_databases(self):
+        admin = get_user_model().objects.create_superuser('admin@gmail.com', 'testpass12345')
+        self.client.force_authenticate(admin)
+        response = self.client.get(DB_METRICS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['default']['vendor'], connection.vendor)
+        self.assertIn('pool', response.data['default'])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs postgresql')
+class PostgresBackendTests(TestCase):
+
+    def _wrapper(self, **settings_dict):
+        # a second wrapper of the default database, with its own connection
+        wrapper = DatabaseWrapper({**connection.settings_dict, **settings_dict}, alias='default')
+        self.addCleanup(close_pools)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pool_reuses_connections(self):
+        wrapper = self._wrapper(CONN_MAX_AGE=0, POOL={'max_size': 2, 'timeout': 1})
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIs(wrapper.connection, raw)
+        metrics = wrapper.metrics()
+        self.assertEqual(metrics['connections_opened'], 1)
+        self.assertEqual(metrics['pool']['checkouts'], 2)
+
+    def test_pool_rolls_back_released_connections(self):
+        wrapper = self._wrapper(CONN_MAX_AGE=0, POOL={'max_size': 1, 'timeout': 1})
+        wrapper.ensure_connection()
+        wrapper.connection.autocommit = False
+        wrapper.connection.cursor().execute('SELECT 1')
+        wrapper.close()
+
+        wrapper.ensure_connection()
+        self.assertEqual(wrapper.connection.get_transaction_status(), TRANSACTION_STATUS_IDLE)
+
+    def test_health_check_replaces_dropped_connection(self):
+        wrapper = self._wrapper(CONN_MAX_AGE=None, CONN_HEALTH_CHECKS=True)
+        wrapper.ensure_connection()
+        dropped = wrapper.connection
+        dropped.close()
+
+        wrapper.close_if_unusable_or_obsolete()
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.assertIsNot(wrapper.connection, dropped)
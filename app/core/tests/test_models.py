@@ -74,3 +74,18 @@ class ModelTests(TestCase):
         file_path = models.recipe_image_file_path(None, 'my_image.jpeg')
         expected_path = f'uploads/recipe/{uuid}.jpeg'
         self.assertEqual(file_path, expected_path)
+
+    def test_recipe_file_name_content_hash(self):
+        recipe = models.Recipe(image_hash='abc123')
+        file_path = models.recipe_image_file_path(recipe, 'my_image.JPEG')
+        self.assertEqual(file_path, 'uploads/recipe/abc123.jpeg')
+
+    def test_collection_version_bump(self):
+        user = sample_user()
+        models.CollectionVersion.objects.bump(user.pk)
+        self.assertFalse(models.CollectionVersion.objects.exists())
+
+        collection = models.CollectionVersion.objects.current(user.pk)
+        self.assertEqual(collection.version, 0)
+        models.CollectionVersion.objects.bump(user.pk)
+        self.assertEqual(models.CollectionVersion.objects.current(user.pk).version, 1)
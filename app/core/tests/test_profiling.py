@@ -0,0 +1,129 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.middleware import ProfilingMiddleware
+from core.models import Recipe, Tag
+from core.profiling import RequestRecorder, instrument_serializers, normalize, recording, registry
+from recipe.serializers import TagSerializer
+
+
+METRICS_URL = reverse('core:metrics')
+RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class ProfilingTests(TestCase):
+
+    def test_normalize_collapses_in_lists(self):
+        self.assertEqual(
+            normalize('SELECT 1 FROM t WHERE id IN (%s, %s, %s)'),
+            normalize('SELECT 1 FROM t WHERE id IN (%s)'),
+        )
+
+    def test_recorder_finds_duplicates(self):
+        recorder = RequestRecorder()
+        for _ in range(3):
+            recorder(lambda *args: None, 'SELECT %s', (1, ), False, {})
+        recorder(lambda *args: None, 'SELECT 2', (), False, {})
+        self.assertEqual(recorder.queries, 4)
+        self.assertEqual(recorder.duplicates(3), [('SELECT %s', 3)])
+
+    def test_serializer_time_recorded_once(self):
+        instrument_serializers()
+        user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        tags = [Tag.objects.create(user=user, name=name) for name in ('Vegan', 'Dessert')]
+        recorder = RequestRecorder()
+        with patch('core.profiling.time.perf_counter', side_effect=[1.0, 1.5]):
+            with recording(recorder):
+                data = TagSerializer(tags, many=True).data
+        self.assertEqual(len(data), 2)
+        self.assertEqual(recorder.serialize_seconds, 0.5)
+        # outside a recording nothing is timed
+        self.assertEqual(TagSerializer(tags[0]).data['name'], 'Vegan')
+
+    @override_settings(PROFILING=False)
+    def test_not_used_when_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+
+@override_settings(PROFILING=True, PROFILING_DUPLICATE_QUERIES=3, PROFILING_SAMPLE_RATE=0)
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        recipe = Recipe.objects.create(user=self.user, title='Soup', time_minutes=10, price=5)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+    def test_records_endpoint(self):
+        response = self.client.get(RECIPES_URL)
+
+        stats = registry.get('RecipeViewSet.list')
+        self.assertEqual(stats.requests, 1)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(stats.sql_seconds, 0)
+        self.assertGreater(stats.serialize_seconds, 0)
+        self.assertGreater(stats.render_seconds, 0)
+        self.assertEqual(stats.response_bytes, len(response.content))
+        self.assertEqual(stats.duplicate_query_requests, 0)
+
+    def test_counts_streamed_bytes(self):
+        response = self.client.get(EXPORT_URL)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(registry.get('RecipeViewSet.export').response_bytes, len(content))
+
+    def test_flags_duplicate_queries(self):
+        def view(request):
+            for tag in Tag.objects.all():
+                Tag.objects.filter(pk=tag.pk).exists()
+                Tag.objects.filter(pk=tag.pk).exists()
+                Tag.objects.filter(pk=tag.pk).exists()
+            return HttpResponse()
+
+        middleware = ProfilingMiddleware(view)
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+
+        self.assertIn('possible N+1', logs.output[0])
+        self.assertEqual(registry.get('unresolved').duplicate_query_requests, 1)
+
+    def test_dumps_sampled_profiles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_DUMP_DIR=directory):
+                self.client.get(RECIPES_URL)
+            dumps = os.listdir(directory)
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].startswith('RecipeViewSet.list-'))
+
+    def test_metrics_endpoint(self):
+        self.client.get(RECIPES_URL)
+        admin = get_user_model().objects.create_superuser('admin@gmail.com', 'testpass12345')
+        self.client.force_authenticate(admin)
+
+        response = self.client.get(METRICS_URL, HTTP_ACCEPT='text/plain')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('recipe_api_requests_total{endpoint="RecipeViewSet.list"} 1\n', body)
+        self.assertIn('recipe_api_request_duration_seconds_count{endpoint="RecipeViewSet.list"} 1\n', body)
+        self.assertIn('# TYPE recipe_api_request_duration_seconds histogram', body)
+        self.assertIn('recipe_api_serialize_seconds_total{endpoint="RecipeViewSet.list"}', body)
+
+    def test_metrics_endpoint_requires_admin(self):
+        response = self.client.get(METRICS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
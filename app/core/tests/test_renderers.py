@@ -0,0 +1,94 @@
+import datetime
+import io
+import os
+import time
+import unittest
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+
+from core import renderers as core_renderers
+from core.models import Recipe, Tag
+from core.parsers import JSONParser
+from core.renderers import JSONRenderer
+from recipe.serializers import RecipeSerializer
+
+PAYLOAD = {
+    'decimal': Decimal('5.50'),
+    'datetime': datetime.datetime(2021, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+    'naive': datetime.datetime(2021, 5, 1, 12, 30, 15, 123456),
+    'date': datetime.date(2021, 5, 1),
+    'time': datetime.time(12, 30, 15, 123456),
+    'duration': datetime.timedelta(minutes=5),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'text': 'café \u2028 \u2029 "quoted"',
+    'nested': [1, 2.5, None, True, ('a', 'b')],
+    1: 'int key',
+}
+
+
+class JSONRendererTests(TestCase):
+
+    def assertSameOutput(self, data, accepted_media_type=None, renderer_context=None):
+        expected = renderers.JSONRenderer().render(data, accepted_media_type, renderer_context)
+        self.assertEqual(JSONRenderer().render(data, accepted_media_type, renderer_context), expected)
+
+    def test_matches_drf_renderer(self):
+        self.assertSameOutput(PAYLOAD)
+
+    def test_line_separators_escaped(self):
+        self.assertEqual(JSONRenderer().render({'text': '\u2028'}), b'{"text":"\\u2028"}')
+
+    def test_indent_and_big_integers_fall_back(self):
+        self.assertSameOutput(PAYLOAD, 'application/json; indent=4')
+        self.assertSameOutput({'big': 2 ** 70})
+
+    def test_none_renders_empty(self):
+        self.assertEqual(JSONRenderer().render(None), b'')
+
+    def test_without_orjson(self):
+        with patch.object(core_renderers, 'orjson', None):
+            self.assertSameOutput(PAYLOAD)
+
+    def test_recipe_list_matches(self):
+        user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        recipe = Recipe.objects.create(user=user, title='Curry', time_minutes=5, price=Decimal('7.5'))
+        recipe.tags.add(Tag.objects.create(user=user, name='Vegan'))
+        self.assertSameOutput(RecipeSerializer(Recipe.objects.all(), many=True).data)
+
+
+class JSONParserTests(TestCase):
+
+    def test_parse(self):
+        data = JSONParser().parse(io.BytesIO('{"name": "café", "items": [1, 2.5]}'.encode()))
+        self.assertEqual(data, {'name': 'café', 'items': [1, 2.5]})
+
+    def test_invalid_json(self):
+        for body in (b'{"name":', b'{"value": NaN}'):
+            with self.assertRaises(ParseError):
+                JSONParser().parse(io.BytesIO(body))
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class JSONRendererBenchmark(TestCase):
+
+    def test_benchmark(self):
+        now = timezone.now()
+        data = [
+            {
+                'id': i, 'title': f'Recipe {i}', 'ingredients': list(range(8)), 'tags': list(range(3)),
+                'time_minutes': i % 90, 'price': Decimal(i % 1000) / 4, 'link': '', 'updated_at': now,
+            }
+            for i in range(5000)
+        ]
+        for name, renderer in (('stdlib', renderers.JSONRenderer()), ('orjson', JSONRenderer())):
+            started = time.perf_counter()
+            for _ in range(10):
+                renderer.render(data)
+            print(f'\n{name}: {(time.perf_counter() - started) / 10 * 1000:.1f}ms per 5000 recipes')
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from core import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('db/', views.DatabaseMetricsView.as_view(), name='db-metrics'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+]
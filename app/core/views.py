@@ -0,0 +1,43 @@
+from django.db import connections
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.authentication import CachedTokenAuthentication
+from core.profiling import registry
+from core.renderers import PrometheusRenderer
+
+
+def database_metrics():
+    """{alias: metrics} of every database of this process"""
+    data = {}
+    for alias in connections:
+        connection = connections[alias]
+        if hasattr(connection, 'metrics'):
+            data[alias] = connection.metrics()
+        else:
+            data[alias] = {
+                'vendor': connection.vendor,
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'pool': None,
+            }
+    return data
+
+
+class DatabaseMetricsView(APIView):
+    """connection settings, connections opened and pool statistics of every database of this process"""
+    authentication_classes = (CachedTokenAuthentication, )
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request):
+        return Response(database_metrics())
+
+
+class MetricsView(APIView):
+    """the per endpoint profile of core.middleware.ProfilingMiddleware and the database metrics, for prometheus"""
+    authentication_classes = (CachedTokenAuthentication, )
+    permission_classes = (IsAdminUser, )
+    renderer_classes = (PrometheusRenderer, )
+
+    def get(self, request):
+        return Response(registry.render_prometheus(database_metrics()))
@@ -0,0 +1,15 @@
+from django.urls import path
+
+from recipe import views
+from recipe.async_views import as_async_view
+
+app_name = 'recipe-async'
+
+# the read endpoints served by async views, for deployments running under ASGI.
+# everything else, writes included, stays on the regular routes
+urlpatterns = [
+    path('tags/', as_async_view(views.TagViewSet, {'get': 'list'}), name='tag-list'),
+    path('ingredient/', as_async_view(views.IngredientViewSet, {'get': 'list'}), name='ingredient-list'),
+    path('recipes/', as_async_view(views.RecipeViewSet, {'get': 'list'}), name='recipe-list'),
+    path('recipes/<int:pk>/', as_async_view(views.RecipeViewSet, {'get': 'retrieve'}), name='recipe-detail'),
+]
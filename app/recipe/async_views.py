@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import functools
+import gc
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+
+from core.profiling import instrument_thread
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_ASYNC_DB_WORKERS,
+                thread_name_prefix='recipe-async-db',
+            )
+        return _executor
+
+
+def shutdown_executor():
+    """stops the database threads and closes the connections they left open"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+        # the connections of finished threads sit in reference cycles until collected
+        gc.collect()
+
+
+def _run(func, *args):
+    # what request_started / request_finished do for a sync request: every
+    # worker keeps its connection for CONN_MAX_AGE and drops broken ones
+    close_old_connections()
+    try:
+        return _call(func, *args)
+    finally:
+        close_old_connections()
+
+
+def _call(func, *args):
+    # queries on this thread count towards the request being profiled, if any
+    with instrument_thread():
+        return func(*args)
+
+
+async def run_in_db_thread(func, *args):
+    """
+    runs func on a thread allowed to use the ORM. 'thread' uses a pool of
+    RECIPE_ASYNC_DB_WORKERS, each holding its own connection, 'sync' uses
+    django's single thread sensitive thread like any other sync code.
+    """
+    if settings.RECIPE_ASYNC_DB_EXECUTOR == 'sync':
+        return await sync_to_async(_call, thread_sensitive=True)(func, *args)
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), functools.partial(context.run, _run, func, *args))
+
+
+def _detach(response):
+    """a plain HttpResponse of a rendered DRF response, so the handler does not hop threads to render it"""
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    plain.cookies = response.cookies
+    return plain
+
+
+def as_async_view(viewset, actions):
+    """
+    an async view running the viewset's own view for actions, so
+    authentication, permissions, filters, pagination, conditional GET and
+    serialization are those of the regular routes. the view and rendering
+    run on a database thread, the event loop only waits for the result.
+    """
+    view = viewset.as_view(actions)
+
+    def handle(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return _detach(response)
+
+    async def async_view(request, *args, **kwargs):
+        return await run_in_db_thread(functools.partial(handle, request, *args, **kwargs))
+
+    async_view.cls = viewset
+    async_view.actions = actions
+    async_view.csrf_exempt = True
+    return async_view
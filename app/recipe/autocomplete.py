@@ -0,0 +1,105 @@
+import logging
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+
+from core.cache import LRUCache
+from recipe.cache import get_version
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 50
+DEFAULT_RESULTS = 10
+
+# sqlstate of a statement cancelled by statement_timeout
+QUERY_CANCELED = '57014'
+
+trie_cache = LRUCache(
+    max_size=settings.RECIPE_AUTOCOMPLETE_CACHE_SIZE, ttl=settings.RECIPE_AUTOCOMPLETE_CACHE_TTL,
+)
+
+
+def _rank(entry):
+    """shorter names complete a prefix more closely, ties go alphabetically"""
+    pk, name = entry
+    return (len(name), name.lower(), pk)
+
+
+class PrefixTrie:
+    """case insensitive prefix index keeping the best MAX_RESULTS entries at every node"""
+
+    def __init__(self, entries):
+        # every node is a (children, results) pair
+        self.root = ({}, [])
+        for entry in sorted(entries, key=_rank):
+            node = self.root
+            self._keep(node, entry)
+            for char in entry[1].lower():
+                node = node[0].setdefault(char, ({}, []))
+                self._keep(node, entry)
+
+    def _keep(self, node, entry):
+        if len(node[1]) < MAX_RESULTS:
+            node[1].append(entry)
+
+    def search(self, prefix, limit):
+        children, results = self.root
+        for char in prefix.lower():
+            if char not in children:
+                return []
+            children, results = children[char]
+        return results[:limit]
+
+
+def get_trie(queryset, user_id):
+    """the trie of the user's names, rebuilt when the tag or ingredient version moves on"""
+    namespace = queryset.model._meta.model_name
+    version = get_version(namespace, user_id)
+    key = (namespace, user_id)
+    cached = trie_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    trie = PrefixTrie(queryset.filter(user_id=user_id).values_list('id', 'name'))
+    trie_cache.set(key, (version, trie))
+    return trie
+
+
+def complete(queryset, user_id, prefix, limit):
+    return get_trie(queryset, user_id).search(prefix, limit)
+
+
+def fuzzy_search(queryset, user_id, term, limit):
+    """
+    typo tolerant search backed by pg_trgm. the query is cancelled once it
+    runs over RECIPE_AUTOCOMPLETE_BUDGET_MS and prefix completion answers instead.
+    other backends only match substrings.
+    """
+    queryset = queryset.filter(user_id=user_id)
+    if connections[queryset.db].vendor != 'postgresql':
+        matches = queryset.filter(name__icontains=term).order_by(Length('name'), 'name', 'id')
+        return list(matches.values_list('id', 'name')[:limit])
+
+    matches = (
+        queryset.filter(Q(name__trigram_similar=term) | Q(name__icontains=term))
+        .annotate(similarity=TrigramSimilarity('name', term))
+        .order_by('-similarity', 'name', 'id')
+        .values_list('id', 'name')
+    )
+    try:
+        with transaction.atomic(using=queryset.db):
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute('SHOW statement_timeout')
+                previous = cursor.fetchone()[0]
+                cursor.execute('SET LOCAL statement_timeout = %s', [settings.RECIPE_AUTOCOMPLETE_BUDGET_MS])
+                results = list(matches[:limit])
+                # SET LOCAL lasts until the outermost transaction ends, which may be the caller's
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [previous])
+            return results
+    except DatabaseError as exc:
+        if getattr(exc.__cause__, 'pgcode', None) != QUERY_CANCELED:
+            raise
+        logger.warning('fuzzy autocomplete ran over budget, answering from the prefix trie')
+        return complete(queryset, user_id, term, limit)
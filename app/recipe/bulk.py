@@ -0,0 +1,217 @@
+from django.db import transaction
+from rest_framework import serializers
+
+from core.bulk import bulk_create_with_pks, delete_without_signals
+from core.models import Recipe, Tag, Ingredient
+from core.signals import bulk_changed, bulk_deleting
+from recipe.fields import resolve_pks
+
+MAX_BULK_ITEMS = 1000
+
+
+def _missing_error(missing):
+    return [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    validates a list payload in one pass and reports errors per item, as a
+    list aligned with the payload. nothing is written unless every item is valid.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and len(data) > MAX_BULK_ITEMS:
+            raise serializers.ValidationError({
+                'non_field_errors': [f'Ensure this list has at most {MAX_BULK_ITEMS} items.'],
+            })
+        # item errors are raised from here, errors raised by validate() would lose their per-item layout
+        return self.validate_items(super().to_internal_value(data))
+
+    @property
+    def user(self):
+        return self.context['request'].user
+
+    def raise_item_errors(self, errors):
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+    def validate_items(self, items):
+        if self.instance is None:
+            return items
+
+        # updates address existing objects of the user by id
+        errors = [{} for _ in items]
+        for index, item in enumerate(items):
+            if 'id' not in item:
+                errors[index]['id'] = ['This field is required.']
+        self.raise_item_errors(errors)
+
+        found, missing = resolve_pks(self.instance, [item['id'] for item in items])
+        for index, item in enumerate(items):
+            if item['id'] in missing:
+                errors[index]['id'] = _missing_error([item['id']])
+            else:
+                item['instance'] = found[item['id']]
+        self.raise_item_errors(errors)
+        return items
+
+
+class RecipeBulkListSerializer(BulkListSerializer):
+    relations = (
+        ('tags', Tag, 'tag_id'),
+        ('ingredients', Ingredient, 'ingredient_id'),
+    )
+
+    def validate_items(self, items):
+        items = super().validate_items(items)
+
+        # resolve every referenced id across the whole payload with one query per relation
+        errors = [{} for _ in items]
+        for field, model, _ in self.relations:
+            pks = [pk for item in items for pk in item.get(field, [])]
+            if not pks:
+                continue
+            _, missing = resolve_pks(model.objects.filter(user=self.user), pks)
+            missing = set(missing)
+            for index, item in enumerate(items):
+                item_missing = [pk for pk in dict.fromkeys(item.get(field, [])) if pk in missing]
+                if item_missing:
+                    errors[index][field] = _missing_error(item_missing)
+        self.raise_item_errors(errors)
+        return items
+
+    def _fields(self, item):
+        return {
+            key: value for key, value in item.items()
+            if key not in ('id', 'instance', 'tags', 'ingredients')
+        }
+
+    def _write_relations(self, pairs, replace):
+        for field, model, column in self.relations:
+            through = getattr(Recipe, field).through
+            recipe_ids = []
+            rows = []
+            for recipe, item in pairs:
+                if field not in item:
+                    continue
+                recipe_ids.append(recipe.pk)
+                rows.extend(
+                    through(recipe_id=recipe.pk, **{column: pk})
+                    for pk in dict.fromkeys(item[field])
+                )
+            if replace and recipe_ids:
+                through.objects.filter(recipe_id__in=recipe_ids).delete()
+            through.objects.bulk_create(rows)
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            recipes = [Recipe(user=self.user, **self._fields(item)) for item in validated_data]
+            bulk_create_with_pks(Recipe, recipes)
+            self._write_relations(list(zip(recipes, validated_data)), replace=False)
+            bulk_changed.send(sender=Recipe, user_id=self.user.pk, action='create', pks=[r.pk for r in recipes])
+        return recipes
+
+    def update(self, instance, validated_data):
+        recipes = []
+        fields = set()
+        for item in validated_data:
+            recipe = item['instance']
+            for key, value in self._fields(item).items():
+                setattr(recipe, key, value)
+                fields.add(key)
+            recipes.append(recipe)
+
+        with transaction.atomic():
+            if fields:
+                Recipe.objects.bulk_update(recipes, sorted(fields))
+            self._write_relations(list(zip(recipes, validated_data)), replace=True)
+            bulk_changed.send(sender=Recipe, user_id=self.user.pk, action='update', pks=[r.pk for r in recipes])
+        return recipes
+
+
+class RecipeBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    ingredients = serializers.ListField(child=serializers.IntegerField(), required=False)
+    tags = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes', 'price', 'link')
+        list_serializer_class = RecipeBulkListSerializer
+
+
+class AttrBulkListSerializer(BulkListSerializer):
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        with transaction.atomic():
+            objects = [model(user=self.user, name=item['name']) for item in validated_data]
+            bulk_create_with_pks(model, objects)
+            bulk_changed.send(sender=model, user_id=self.user.pk, action='create', pks=[obj.pk for obj in objects])
+        return objects
+
+    def update(self, instance, validated_data):
+        model = self.child.Meta.model
+        objects = []
+        for item in validated_data:
+            obj = item['instance']
+            if 'name' in item:
+                obj.name = item['name']
+            objects.append(obj)
+        with transaction.atomic():
+            model.objects.bulk_update(objects, ['name'])
+            bulk_changed.send(sender=model, user_id=self.user.pk, action='update', pks=[obj.pk for obj in objects])
+        return objects
+
+
+class TagBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Tag
+        fields = ('id', 'name')
+        list_serializer_class = AttrBulkListSerializer
+
+
+class IngredientBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Ingredient
+        fields = ('id', 'name')
+        list_serializer_class = AttrBulkListSerializer
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=MAX_BULK_ITEMS)
+
+    def delete(self, queryset, user_id):
+        """deletes the objects in one transaction, reporting unknown ids instead of skipping them"""
+        ids = list(dict.fromkeys(self.validated_data['ids']))
+        with transaction.atomic():
+            _, missing = resolve_pks(queryset, ids)
+            if missing:
+                raise serializers.ValidationError({'ids': _missing_error(missing)})
+            delete_objects(queryset.model, user_id, ids)
+        return len(ids)
+
+
+def delete_objects(model, user_id, pks):
+    """
+    deletes recipes, tags or ingredients with a few set based statements.
+    the collector would send pre_delete and post_delete for every object,
+    receivers get a single bulk_changed instead.
+    """
+    bulk_deleting.send(sender=model, user_id=user_id, pks=pks)
+    recipe_ids = []
+    if model is Recipe:
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            through.objects.filter(recipe_id__in=pks).delete()
+    else:
+        through = Recipe.tags.through if model is Tag else Recipe.ingredients.through
+        column = 'tag_id' if model is Tag else 'ingredient_id'
+        links = through.objects.filter(**{f'{column}__in': pks})
+        recipe_ids = list(links.values_list('recipe_id', flat=True).distinct())
+        links.delete()
+    delete_without_signals(model.objects.filter(pk__in=pks))
+    bulk_changed.send(sender=model, user_id=user_id, action='delete', pks=pks, recipe_ids=recipe_ids)
@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.db.routers import replica_reads_enabled
+from core.models import CollectionVersion
+
+
+def get_cache():
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def _version_key(namespace, user_id):
+    return f'recipe:version:{namespace}:{user_id}'
+
+
+def get_version(namespace, user_id):
+    """
+    returns the per user version of a namespace. keys built from it are
+    orphaned by bump_version instead of being deleted one by one.
+    """
+    cache = get_cache()
+    key = _version_key(namespace, user_id)
+    version = cache.get(key)
+    if version is None:
+        # seeding from the clock means an evicted counter never restarts
+        # at a value that older cached entries were built from
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, user_id):
+    cache = get_cache()
+    key = _version_key(namespace, user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def attr_list_key(model, user_id, version, variant):
+    """
+    keyed on the user's CollectionVersion, which every worker reads from the
+    database, so a write made through any worker orphans the cached lists.
+    callers pass the version their ETag was built from, body and ETag agree.
+    """
+    return f'recipe:attrs:{model._meta.model_name}:{user_id}:{version}:{variant}'
+
+
+def get_attr_list(model, user_id, version, variant):
+    return get_cache().get(attr_list_key(model, user_id, version, variant))
+
+
+def set_attr_list(model, user_id, version, variant, data):
+    get_cache().set(attr_list_key(model, user_id, version, variant), data, settings.RECIPE_ATTR_CACHE_TIMEOUT)
+
+
+def invalidate_attr_lists(model, user_id):
+    """orphans the prefix tries of a model, cached lists follow the collection version"""
+    bump_version(model._meta.model_name, user_id)
+
+
+def get_collection_state(user_id):
+    """
+    (version, updated_at) of the user's CollectionVersion. it is read from the
+    database on every request, a single primary key lookup, because a copy in
+    a per process cache would keep answering 304 after another worker wrote.
+    the read goes where the rest of the request reads, so a list served by a
+    lagging replica is tagged with the version that replica has. None when
+    reading from a replica that has no row yet, on the primary it is created.
+    """
+    state = CollectionVersion.objects.filter(user_id=user_id).values_list('version', 'updated_at').first()
+    if state is None and not replica_reads_enabled():
+        collection = CollectionVersion.objects.current(user_id)
+        state = collection.version, collection.updated_at
+    return state
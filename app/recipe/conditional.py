@@ -0,0 +1,79 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.db.routers import replica_reads
+from recipe.cache import get_collection_state
+
+
+class ConditionalGetMixin:
+    """
+    adds strong ETag and Last-Modified headers to list and retrieve and
+    answers If-None-Match / If-Modified-Since with 304 before anything is
+    serialized. lists are versioned by the user's CollectionVersion, details
+    by the updated_at of the object.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        try:
+            updated_at = queryset.filter(**{self.lookup_field: lookup}).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            # a malformed lookup, get_object() answers it with a 404
+            updated_at = None
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request, ('detail', lookup, updated_at.isoformat()), updated_at,
+            super().retrieve, *args, **kwargs
+        )
+
+    def conditional_list(self, request, handler, *args, **kwargs):
+        state = get_collection_state(request.user.pk)
+        if state is None:
+            # the replica has no version yet, version and body both come from the primary
+            with replica_reads(False):
+                return self.conditional_list(request, handler, *args, **kwargs)
+        version, updated_at = state
+        # handlers caching the body key it on this version, not a fresh read
+        self.collection_version = version
+        return self.conditional_response(
+            request, ('list', version), updated_at,
+            handler, *args, **kwargs
+        )
+
+    def conditional_response(self, request, key, last_modified, handler, *args, **kwargs):
+        etag = self.get_etag(request, key)
+        if self.is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def get_etag(self, request, key):
+        """the etag covers the view, the user, the full url and the response format"""
+        parts = (
+            type(self).__name__, self.action, request.user.pk,
+            request.get_full_path(), request.accepted_renderer.format,
+        ) + tuple(key)
+        digest = hashlib.sha1(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+        return f'"{digest}"'
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and int(last_modified.timestamp()) <= if_modified_since
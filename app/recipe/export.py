@@ -0,0 +1,56 @@
+from itertools import islice
+
+from core.models import Recipe
+from core.renderers import JSONRenderer
+from recipe.serializers import RecipeDetailSerializer
+
+CHUNK_SIZE = 500
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_recipes(queryset, context, chunk_size=None):
+    """
+    serialized recipes of queryset in id order. ids come from a server side
+    cursor and every chunk is loaded with its own prefetches, so at most
+    chunk_size recipes are held in memory at once.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    ids = queryset.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+    for chunk in chunked(ids, chunk_size):
+        recipes = RecipeDetailSerializer.setup_eager_loading(Recipe.objects.filter(pk__in=chunk).order_by('id'))
+        yield from RecipeDetailSerializer(recipes, many=True, context=context).data
+
+
+def render_json(items):
+    """a json array written item by item"""
+    renderer = JSONRenderer()
+    separator = b'['
+    for item in items:
+        yield separator + renderer.render(item)
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
+
+
+def render_ndjson(items):
+    renderer = JSONRenderer()
+    for item in items:
+        yield renderer.render(item) + b'\n'
+
+
+RENDERERS = {
+    'json': render_json,
+    'ndjson': render_ndjson,
+}
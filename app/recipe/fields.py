@@ -0,0 +1,58 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+
+
+def resolve_pks(queryset, pks):
+    """fetches the objects for pks in a single query, returns (objects by pk, missing pks)"""
+    found = queryset.filter(pk__in=set(pks)).in_bulk()
+    missing = [pk for pk in dict.fromkeys(pks) if pk not in found]
+    return found, missing
+
+
+class BatchManyRelatedField(ManyRelatedField):
+    """resolves every submitted pk with one id__in query and reports all missing pks together"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks = []
+        for value in data:
+            if isinstance(value, bool):
+                child.fail('incorrect_type', data_type=type(value).__name__)
+            try:
+                pks.append(pk_field.to_python(value))
+            except DjangoValidationError:
+                child.fail('incorrect_type', data_type=type(value).__name__)
+
+        found, missing = resolve_pks(queryset, pks)
+        if missing:
+            raise serializers.ValidationError([
+                child.error_messages['does_not_exist'].format(pk_value=pk) for pk in missing
+            ], code='does_not_exist')
+        return [found[pk] for pk in dict.fromkeys(pks)]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """primary key field limited to objects of the requesting user, resolved in batches when many=True"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is None:
+            return queryset.none()
+        return queryset.filter(user=request.user)
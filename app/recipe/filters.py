@@ -0,0 +1,58 @@
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from core.models import Recipe
+from recipe.search import search
+
+
+class RecipeRelationFilter(BaseFilterBackend):
+    """
+    filters recipes by tag and ingredient ids, e.g. ?tags=1,2&ingredients=3&match=all.
+    every condition is an EXISTS subquery on the through table, so a recipe
+    is returned once no matter how many of the requested ids it has.
+    """
+    match_query_param = 'match'
+    relations = (
+        ('tags', Recipe.tags.through, 'tag_id'),
+        ('ingredients', Recipe.ingredients.through, 'ingredient_id'),
+    )
+
+    def filter_queryset(self, request, queryset, view):
+        match = request.query_params.get(self.match_query_param, 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({self.match_query_param: 'Must be either "any" or "all".'})
+
+        for param, through, column in self.relations:
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            ids = self._params_to_int(param, value)
+            related = through.objects.filter(recipe_id=OuterRef('pk'))
+            if match == 'all':
+                for related_id in ids:
+                    queryset = queryset.filter(Exists(related.filter(**{column: related_id})))
+            else:
+                queryset = queryset.filter(Exists(related.filter(**{f'{column}__in': ids})))
+        return queryset
+
+    def _params_to_int(self, param, value):
+        """converts a comma separated string of IDs to a set of integers"""
+        try:
+            return {int(str_id) for str_id in value.split(',')}
+        except ValueError:
+            raise ValidationError({param: 'Must be a comma separated list of integer IDs.'})
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """?q= search over titles, tag and ingredient names, best matches first where ranking is available"""
+    search_query_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_query_param, '').strip()
+        if not terms:
+            return queryset
+        queryset = search(queryset, terms)
+        if 'search_rank' in queryset.query.annotations:
+            queryset = queryset.order_by('-search_rank', '-id')
+        return queryset
@@ -0,0 +1,94 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from core.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'uploads/recipe/variants/'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_formats():
+    """(extension, pillow format) pairs every variant is written in"""
+    formats = [('jpg', 'JPEG')]
+    if features.check('webp'):
+        formats.append(('webp', 'WEBP'))
+    return formats
+
+
+def _encode(image, image_format):
+    """re-encodes without passing exif on, which strips it from the variant"""
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(recipe_id):
+    """writes resized variants of a recipe image and records their names on the recipe"""
+    recipe = Recipe.objects.filter(pk=recipe_id).only('id', 'image').first()
+    if recipe is None or not recipe.image:
+        return
+    source_name = recipe.image.name
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+
+    with recipe.image.open('rb') as source:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+    variants = {}
+    for label, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size))
+        variants[label] = {}
+        for extension, image_format in variant_formats():
+            name = f'{VARIANT_DIR}{stem}-{label}.{extension}'
+            # variant names derive from the source name, an existing file is already this variant
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(_encode(resized, image_format)))
+            variants[label][extension] = name
+
+    # the image may have been replaced while this one was processed
+    Recipe.objects.filter(pk=recipe_id, image=source_name).update(image_variants=variants)
+
+
+def _run(recipe_id):
+    try:
+        generate_variants(recipe_id)
+    except Exception:
+        logger.exception('generating image variants failed for recipe %s', recipe_id)
+    finally:
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+        return _executor
+
+
+def schedule_variants(recipe_id):
+    """queues variant generation once the current transaction commits"""
+    def submit():
+        if settings.RECIPE_IMAGE_PROCESSING == 'sync':
+            generate_variants(recipe_id)
+        else:
+            _get_executor().submit(_run, recipe_id)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,57 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import Exists, F, FloatField, OuterRef, Q, Subquery
+from django.db.models.functions import Cast
+
+from core.models import Ingredient, Recipe, Tag
+
+SEARCH_CONFIG = 'english'
+
+
+def is_supported(using):
+    return connections[using].vendor == 'postgresql'
+
+
+def _names(model):
+    """space separated names of the tags or ingredients of the outer recipe"""
+    return Subquery(
+        model.objects.filter(recipe=OuterRef('pk'))
+        .values('recipe')
+        .annotate(names=StringAgg('name', ' '))
+        .values('names')
+    )
+
+
+def update_search_vectors(recipe_ids):
+    """recomputes the search vectors of the given recipes in a single UPDATE"""
+    queryset = Recipe.objects.filter(pk__in=recipe_ids)
+    if not recipe_ids or not is_supported(queryset.db):
+        return
+    queryset.update(search_vector=(
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(_names(Tag), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_names(Ingredient), weight='C', config=SEARCH_CONFIG)
+    ))
+
+
+def search(queryset, terms):
+    """
+    ranked full-text search over recipe titles, tag and ingredient names.
+    without postgres every word has to appear in one of them, unranked.
+    """
+    if is_supported(queryset.db):
+        query = SearchQuery(terms, search_type='websearch', config=SEARCH_CONFIG)
+        # ts_rank returns a real, as double precision the rank survives the
+        # round trip through a pagination cursor and compares equal again
+        return queryset.annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+        ).filter(search_vector=query)
+
+    for word in terms.split():
+        queryset = queryset.filter(
+            Q(title__icontains=word)
+            | Exists(Tag.objects.filter(recipe=OuterRef('pk'), name__icontains=word))
+            | Exists(Ingredient.objects.filter(recipe=OuterRef('pk'), name__icontains=word))
+        )
+    return queryset
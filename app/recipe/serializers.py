@@ -1,5 +1,8 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from core.models import Recipe, Tag, Ingredient
+from core.models import Recipe, Tag, Ingredient, recipe_image_file_path
+from recipe.fields import UserPrimaryKeyRelatedField
+from recipe.uploads import BoundedImageField, content_hash
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -16,12 +19,26 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', )
 
 
+class TagUsageSerializer(TagSerializer):
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('recipe_count', )
+
+
+class IngredientUsageSerializer(IngredientSerializer):
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ('recipe_count', )
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -31,14 +48,48 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes', 'price', 'link')
         read_only_fields = ('id', )
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """prefetches what this serializer reads so output costs a fixed number of queries"""
+        return queryset.with_related_ids()
+
 
 class RecipeDetailSerializer(RecipeSerializer):
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.with_related_objects()
+
 
 class RecipeImageSerializer(serializers.ModelSerializer):
+    image = BoundedImageField()
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_variants')
         read_only_fields = ('id', )
+
+    def get_image_variants(self, recipe):
+        """urls of the resized copies, empty until background processing has finished"""
+        request = self.context.get('request')
+        variants = {}
+        for label, names in recipe.image_variants.items():
+            variants[label] = {}
+            for extension, name in names.items():
+                url = default_storage.url(name)
+                variants[label][extension] = request.build_absolute_uri(url) if request else url
+        return variants
+
+    def update(self, instance, validated_data):
+        """stores the image under its content hash, reusing the file when identical bytes exist"""
+        image = validated_data.pop('image')
+        instance.image_hash = content_hash(image)
+        name = recipe_image_file_path(instance, image.name)
+        if default_storage.exists(name):
+            instance.image.name = name
+        else:
+            instance.image.save(image.name, image, save=False)
+        return super().update(instance, validated_data)
@@ -0,0 +1,328 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import ChangeLogEntry, CollectionVersion, Ingredient, Recipe, Tag
+from core.signals import bulk_changed, bulk_deleting
+from recipe.cache import invalidate_attr_lists
+from recipe import similarity, stats
+from recipe.search import update_search_vectors
+from recipe.sync import record_changes
+
+
+def m2m_recipe_ids(instance, action, reverse, pk_set):
+    """ids of the recipes whose tags or ingredients an m2m_changed signal is about"""
+    if not reverse:
+        return [instance.pk]
+    if action.endswith('_clear'):
+        return getattr(instance, '_cleared_recipe_ids', [])
+    return list(pk_set or [])
+
+
+def attr_recipe_ids(model, pks):
+    """ids of the recipes that use any of the given tags or ingredients"""
+    lookup = 'tags__in' if model is Tag else 'ingredients__in'
+    return list(Recipe.objects.filter(**{lookup: pks}).values_list('pk', flat=True).distinct())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def remember_cleared_recipes(sender, instance, action, reverse, **kwargs):
+    """clearing from the tag or ingredient side sends no pks, so collect them before they are gone"""
+    if reverse and action == 'pre_clear':
+        instance._cleared_recipe_ids = list(instance.recipe_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_attr_recipes(sender, instance, **kwargs):
+    """the through rows are cascaded away without m2m_changed, keep the recipes they linked"""
+    instance._recipe_ids = attr_recipe_ids(sender, [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_on_attr_change(sender, instance, **kwargs):
+    invalidate_attr_lists(sender, instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_on_recipe_delete(sender, instance, **kwargs):
+    """deleting a recipe can unassign its tags and ingredients"""
+    invalidate_attr_lists(Tag, instance.user_id)
+    invalidate_attr_lists(Ingredient, instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_membership_change(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    model = Tag if sender is Recipe.tags.through else Ingredient
+    invalidate_attr_lists(model, instance.user_id)
+
+
+@receiver(bulk_changed)
+def invalidate_on_bulk_change(sender, user_id, **kwargs):
+    if sender is Recipe:
+        invalidate_attr_lists(Tag, user_id)
+        invalidate_attr_lists(Ingredient, user_id)
+    elif sender in (Tag, Ingredient):
+        invalidate_attr_lists(sender, user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector_on_save(sender, instance, **kwargs):
+    update_search_vectors([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_search_vector_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        update_search_vectors(m2m_recipe_ids(instance, action, reverse, pk_set))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_search_vector_on_rename(sender, instance, created, **kwargs):
+    if not created:
+        update_search_vectors(attr_recipe_ids(sender, [instance.pk]))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_search_vector_on_attr_delete(sender, instance, **kwargs):
+    update_search_vectors(getattr(instance, '_recipe_ids', []))
+
+
+@receiver(bulk_changed)
+def update_search_vector_on_bulk_change(sender, action, pks, recipe_ids=(), **kwargs):
+    if sender is Recipe and action != 'delete':
+        update_search_vectors(pks)
+    elif sender in (Tag, Ingredient) and action == 'update':
+        update_search_vectors(attr_recipe_ids(sender, pks))
+    elif sender in (Tag, Ingredient) and action == 'delete':
+        update_search_vectors(list(recipe_ids))
+
+
+def touch_recipes(recipe_ids):
+    """moves updated_at of recipes whose nested tags or ingredients changed, auto_now only fires on save()"""
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=timezone.now())
+
+
+def bump_collection(user_id):
+    CollectionVersion.objects.bump(user_id)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_collection_on_change(sender, instance, **kwargs):
+    bump_collection(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        touch_recipes(m2m_recipe_ids(instance, action, reverse, pk_set))
+        bump_collection(instance.user_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_on_rename(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(attr_recipe_ids(sender, [instance.pk]))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def touch_on_attr_delete(sender, instance, **kwargs):
+    touch_recipes(getattr(instance, '_recipe_ids', []))
+
+
+@receiver(bulk_changed)
+def touch_on_bulk_change(sender, user_id, action, pks, recipe_ids=(), **kwargs):
+    if sender is Recipe and action == 'update':
+        # bulk_update does not apply auto_now
+        touch_recipes(pks)
+    elif sender in (Tag, Ingredient) and action == 'update':
+        sender.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+        touch_recipes(attr_recipe_ids(sender, pks))
+    elif sender in (Tag, Ingredient) and action == 'delete':
+        touch_recipes(list(recipe_ids))
+    bump_collection(user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def log_save(sender, instance, **kwargs):
+    record_changes(sender, instance.user_id, [instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def log_delete(sender, instance, **kwargs):
+    record_changes(sender, instance.user_id, [instance.pk], ChangeLogEntry.DELETE)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def log_attr_delete_on_recipes(sender, instance, **kwargs):
+    """the recipes lost a tag or ingredient"""
+    record_changes(Recipe, instance.user_id, getattr(instance, '_recipe_ids', []))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def log_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        record_changes(Recipe, instance.user_id, m2m_recipe_ids(instance, action, reverse, pk_set))
+
+
+@receiver(bulk_changed)
+def log_bulk_change(sender, user_id, action, pks, recipe_ids=(), **kwargs):
+    if sender not in (Recipe, Tag, Ingredient):
+        return
+    if action == 'delete':
+        record_changes(sender, user_id, pks, ChangeLogEntry.DELETE)
+        # the recipes lost a tag or ingredient
+        record_changes(Recipe, user_id, recipe_ids)
+    else:
+        record_changes(sender, user_id, pks)
+
+
+@receiver(post_delete, sender=get_user_model())
+def purge_change_log(sender, instance, **kwargs):
+    """recipes deleted along with their user log entries after the user's own were cascaded"""
+    ChangeLogEntry.objects.filter(user_id=instance.pk).delete()
+
+
+def _relation(sender):
+    """(tag or ingredient model, through column) of a through model"""
+    if sender is Recipe.tags.through:
+        return Tag, 'tag_id'
+    return Ingredient, 'ingredient_id'
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_stats_values(sender, instance, **kwargs):
+    if not instance._state.adding:
+        old = Recipe.objects.filter(pk=instance.pk).values('time_minutes', 'price').first()
+        instance._stats_old = stats.recipe_values(Recipe(**old)) if old else None
+
+
+@receiver(post_save, sender=Recipe)
+def update_stats_on_save(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_stats_old', None)
+    stats.record_recipe(instance.user_id, old, stats.recipe_values(instance))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_attrs(sender, instance, **kwargs):
+    """the through rows are cascaded away without m2m_changed"""
+    if stats.is_materialized(instance.user_id):
+        instance._attr_ids = stats.recipe_attr_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def update_stats_on_delete(sender, instance, **kwargs):
+    attr_ids = getattr(instance, '_attr_ids', None)
+    if attr_ids is None:
+        return
+    stats.record_recipe(instance.user_id, stats.recipe_values(instance), None)
+    for model, pks in attr_ids.items():
+        stats.record_usage(instance.user_id, model, {pk: -1 for pk in pks})
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def forget_attr_usage(sender, instance, **kwargs):
+    stats.forget_usage(sender, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_usage_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    model, column = _relation(sender)
+    if action == 'pre_remove':
+        # remove() reports the pks it was given, linked or not
+        if reverse:
+            links = sender.objects.filter(recipe_id__in=pk_set, **{column: instance.pk})
+        else:
+            links = sender.objects.filter(recipe_id=instance.pk, **{f'{column}__in': pk_set})
+        instance._removed_pks = set(links.values_list('recipe_id' if reverse else column, flat=True))
+    elif action == 'pre_clear' and not reverse:
+        instance._cleared_attr_ids = list(sender.objects.filter(recipe_id=instance.pk).values_list(column, flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_add':
+        pks, delta = pk_set, 1
+    elif action == 'post_remove':
+        pks, delta = getattr(instance, '_removed_pks', set()), -1
+    elif reverse:
+        pks, delta = getattr(instance, '_cleared_recipe_ids', []), -1
+    else:
+        pks, delta = getattr(instance, '_cleared_attr_ids', []), -1
+
+    if reverse:
+        stats.record_usage(instance.user_id, model, {instance.pk: delta * len(pks)})
+    else:
+        stats.record_usage(instance.user_id, model, {pk: delta for pk in pks})
+
+
+@receiver(bulk_changed)
+def update_stats_on_bulk_change(sender, user_id, action, pks, **kwargs):
+    """
+    bulk creates are applied from the new recipes alone, bulk deletes from
+    the old ones in update_stats_on_bulk_delete. bulk updates carry no old
+    values, the summary is rebuilt for them when the user has one. usage
+    counts of deleted tags and ingredients are dropped.
+    """
+    if sender in (Tag, Ingredient) and action == 'delete':
+        stats.forget_usage(sender, pks)
+    if sender is not Recipe:
+        return
+    if action == 'create':
+        stats.record_created(user_id, pks)
+    elif action == 'update' and stats.is_materialized(user_id):
+        stats.rebuild(user_id)
+
+
+@receiver(bulk_deleting)
+def update_stats_on_bulk_delete(sender, user_id, pks, **kwargs):
+    if sender is Recipe:
+        stats.record_deleted(user_id, pks)
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_similarity_on_create(sender, instance, created, **kwargs):
+    if created:
+        similarity.invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_similarity_on_delete(sender, instance, **kwargs):
+    similarity.invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_similarity_on_membership_change(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        similarity.invalidate(instance.user_id)
+
+
+@receiver(bulk_changed)
+def invalidate_similarity_on_bulk_change(sender, user_id, action, **kwargs):
+    if sender is Recipe or action == 'delete':
+        similarity.invalidate(user_id)
@@ -0,0 +1,120 @@
+from collections import defaultdict
+
+from django.conf import settings
+
+from core.cache import LRUCache
+from core.models import Recipe
+from recipe.cache import bump_version, get_version
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+MAX_RESULTS = 50
+DEFAULT_RESULTS = 10
+
+NAMESPACE = 'similarity'
+
+index_cache = LRUCache(max_size=settings.RECIPE_SIMILARITY_CACHE_SIZE, ttl=settings.RECIPE_SIMILARITY_CACHE_TTL)
+
+
+class SimilarityIndex:
+    """
+    recipes of one user as binary rows over their tags and ingredients,
+    scored by jaccard similarity. a sparse matrix product scores every row
+    at once when scipy is installed, otherwise an inverted index only visits
+    recipes sharing at least one feature.
+    """
+
+    def __init__(self, recipe_ids, links):
+        self.ids = sorted(recipe_ids)
+        self.rows = {pk: row for row, pk in enumerate(self.ids)}
+        features = defaultdict(set)
+        for recipe_id, feature in links:
+            if recipe_id in self.rows:
+                features[self.rows[recipe_id]].add(feature)
+
+        if sparse is not None:
+            columns = {}
+            row_index, column_index = [], []
+            for row, row_features in features.items():
+                for feature in row_features:
+                    row_index.append(row)
+                    column_index.append(columns.setdefault(feature, len(columns)))
+            self.matrix = sparse.csr_matrix(
+                (numpy.ones(len(row_index), dtype=numpy.float32), (row_index, column_index)),
+                shape=(len(self.ids), len(columns)),
+            )
+            self.sizes = numpy.asarray(self.matrix.sum(axis=1), dtype=numpy.float32).ravel()
+        else:
+            self.features = features
+            self.postings = defaultdict(list)
+            for row, row_features in features.items():
+                for feature in row_features:
+                    self.postings[feature].append(row)
+
+    def similar(self, recipe_id, limit):
+        """[(recipe id, score)] of the most similar other recipes, best first, ties by id"""
+        row = self.rows.get(recipe_id)
+        if row is None:
+            return []
+        scores = self._matrix_scores(row, limit) if sparse is not None else self._postings_scores(row)
+        # ids are sorted, so the row breaks ties by id
+        ranked = sorted(scores, key=lambda item: (-item[1], item[0]))[:limit]
+        return [(self.ids[other], score) for other, score in ranked]
+
+    def _matrix_scores(self, row, limit):
+        intersections = (self.matrix @ self.matrix[row].T).toarray().ravel()
+        unions = self.sizes + self.sizes[row] - intersections
+        scores = numpy.divide(intersections, unions, out=numpy.zeros_like(intersections), where=unions > 0)
+        scores[row] = 0
+        candidates = numpy.flatnonzero(scores)
+        if len(candidates) > limit:
+            # only rows scoring at least the limit-th best score need sorting
+            cutoff = numpy.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+            candidates = candidates[scores[candidates] >= cutoff]
+        return [(int(other), float(scores[other])) for other in candidates]
+
+    def _postings_scores(self, row):
+        own = self.features.get(row, set())
+        intersections = defaultdict(int)
+        for feature in own:
+            for other in self.postings[feature]:
+                if other != row:
+                    intersections[other] += 1
+        return [
+            (other, shared / (len(own) + len(self.features[other]) - shared))
+            for other, shared in intersections.items()
+        ]
+
+
+def build_index(user_id):
+    links = []
+    for field, prefix in (('tags', 't'), ('ingredients', 'i')):
+        column = 'tag_id' if field == 'tags' else 'ingredient_id'
+        through = getattr(Recipe, field).through
+        rows = through.objects.filter(recipe__user_id=user_id).values_list('recipe_id', column)
+        links.extend((recipe_id, (prefix, pk)) for recipe_id, pk in rows)
+    recipe_ids = Recipe.objects.filter(user_id=user_id).values_list('id', flat=True)
+    return SimilarityIndex(recipe_ids, links)
+
+
+def get_index(user_id):
+    """the user's index, rebuilt lazily once invalidate() moved their version on"""
+    version = get_version(NAMESPACE, user_id)
+    cached = index_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    index = build_index(user_id)
+    index_cache.set(user_id, (version, index))
+    return index
+
+
+def invalidate(user_id):
+    bump_version(NAMESPACE, user_id)
+
+
+def similar(user_id, recipe_id, limit):
+    return get_index(user_id).similar(recipe_id, limit)
@@ -0,0 +1,269 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+
+from core.models import AttrUsage, Ingredient, Recipe, RecipeStats, RecipeValueCount, Tag
+
+PERCENTILES = (50, 90, 99)
+DEFAULT_TOP = 10
+MAX_TOP = 50
+
+VALUE_FIELDS = ('time_minutes', 'price')
+ATTR_MODELS = (Tag, Ingredient)
+
+
+def recipe_values(recipe):
+    """the summarized fields of a recipe, normalized the way they are stored"""
+    return {
+        'time_minutes': int(recipe.time_minutes),
+        'price': Decimal(str(recipe.price)).quantize(Decimal('0.01')),
+    }
+
+
+def _upsert(model, lookup, delta):
+    """adds delta to the count of the row matching lookup, creating it when missing and delta is positive"""
+    if model.objects.filter(**lookup).update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=delta, **lookup)
+    except IntegrityError:
+        # created concurrently in between
+        model.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def _add_counts(model, lookup, key, deltas, chunk_size=500):
+    """
+    adds {key value: delta} to the counts of the rows of model matching lookup.
+    existing rows are moved by one relative UPDATE per chunk, missing rows
+    are inserted together, so a large batch costs a handful of statements.
+    """
+    deltas = {value: delta for value, delta in deltas.items() if delta}
+    values = list(deltas)
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        rows = model.objects.filter(**lookup, **{f'{key}__in': chunk})
+        existing = set(rows.values_list(key, flat=True))
+        if existing:
+            rows.filter(**{f'{key}__in': existing}).update(count=F('count') + Case(
+                *[When(**{key: value}, then=Value(deltas[value])) for value in existing],
+                output_field=IntegerField(),
+            ))
+        missing = [value for value in chunk if value not in existing and deltas[value] > 0]
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([model(count=deltas[value], **lookup, **{key: value}) for value in missing])
+        except IntegrityError:
+            # some were created concurrently in between
+            for value in missing:
+                _upsert(model, {**lookup, key: value}, deltas[value])
+
+
+def is_materialized(user_id):
+    return RecipeStats.objects.filter(user_id=user_id).exists()
+
+
+def record_recipe(user_id, old, new):
+    """
+    applies a recipe going from old to new values, both {field: value} or
+    None for a created or deleted recipe. users whose summary was never built
+    are skipped, their summary is built from scratch on first read.
+    """
+    count = (new is not None) - (old is not None)
+    deltas = {
+        field: (new[field] if new else 0) - (old[field] if old else 0)
+        for field in VALUE_FIELDS
+    }
+    if not count and not any(deltas.values()):
+        return
+    updated = RecipeStats.objects.filter(user_id=user_id).update(
+        recipe_count=F('recipe_count') + count,
+        time_minutes_sum=F('time_minutes_sum') + deltas['time_minutes'],
+        price_sum=F('price_sum') + deltas['price'],
+    )
+    if not updated:
+        return
+    for field in VALUE_FIELDS:
+        if old and new and old[field] == new[field]:
+            continue
+        if old:
+            lookup = {'user_id': user_id, 'field': field, 'value': old[field]}
+            RecipeValueCount.objects.filter(**lookup).update(count=F('count') - 1)
+            RecipeValueCount.objects.filter(count__lte=0, **lookup).delete()
+        if new:
+            _upsert(RecipeValueCount, {'user_id': user_id, 'field': field, 'value': new[field]}, 1)
+
+
+def record_usage(user_id, model, deltas):
+    """adds {object id: delta} to the usage counts of the user's tags or ingredients"""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas or not is_materialized(user_id):
+        return
+    _add_counts(AttrUsage, {'user_id': user_id, 'model': model._meta.model_name}, 'object_id', deltas)
+
+
+def _relation(model):
+    """(through model, column) linking recipes to a tag or ingredient model"""
+    if model is Tag:
+        return Recipe.tags.through, 'tag_id'
+    return Recipe.ingredients.through, 'ingredient_id'
+
+
+def _record_bulk(user_id, recipe_ids, sign):
+    """applies recipes and their links as created (sign 1) or deleted (sign -1), from aggregates over them"""
+    if not recipe_ids or not is_materialized(user_id):
+        return
+    recipes = Recipe.objects.filter(pk__in=recipe_ids)
+    totals = recipes.aggregate(count=Count('id'), time_minutes=Sum('time_minutes'), price=Sum('price'))
+    if not totals['count']:
+        return
+    RecipeStats.objects.filter(user_id=user_id).update(
+        recipe_count=F('recipe_count') + sign * totals['count'],
+        time_minutes_sum=F('time_minutes_sum') + sign * totals['time_minutes'],
+        price_sum=F('price_sum') + sign * totals['price'],
+    )
+    for field in VALUE_FIELDS:
+        counts = recipes.order_by().values_list(field).annotate(count=Count('id'))
+        lookup = {'user_id': user_id, 'field': field}
+        _add_counts(RecipeValueCount, lookup, 'value', {value: sign * count for value, count in counts})
+    for model in ATTR_MODELS:
+        through, column = _relation(model)
+        links = through.objects.filter(recipe_id__in=recipe_ids).order_by()
+        usage = links.values_list(column).annotate(count=Count('id'))
+        lookup = {'user_id': user_id, 'model': model._meta.model_name}
+        _add_counts(AttrUsage, lookup, 'object_id', {pk: sign * count for pk, count in usage})
+    if sign < 0:
+        RecipeValueCount.objects.filter(user_id=user_id, count__lte=0).delete()
+
+
+def record_created(user_id, recipe_ids):
+    """
+    applies recipes created in bulk together with their tags and ingredients,
+    from aggregates over just those recipes instead of the whole collection
+    """
+    _record_bulk(user_id, recipe_ids, 1)
+
+
+def record_deleted(user_id, recipe_ids):
+    """like record_created for recipes about to be deleted in bulk, called while their rows still exist"""
+    _record_bulk(user_id, recipe_ids, -1)
+
+
+def recipe_attr_ids(recipe_id):
+    """{tag or ingredient model: ids} linked to a recipe, read in one query"""
+    tags, ingredients = (
+        through.objects.filter(recipe_id=recipe_id).annotate(model=Value(model._meta.model_name))
+        .values_list('model', column)
+        for through, column, model in (_relation(model) + (model, ) for model in ATTR_MODELS)
+    )
+    attr_ids = {model: [] for model in ATTR_MODELS}
+    models = {model._meta.model_name: model for model in ATTR_MODELS}
+    for model_name, pk in tags.union(ingredients, all=True):
+        attr_ids[models[model_name]].append(pk)
+    return attr_ids
+
+
+def forget_usage(model, pks):
+    AttrUsage.objects.filter(model=model._meta.model_name, object_id__in=pks).delete()
+
+
+def rebuild(user_id, missing_only=False):
+    """
+    recomputes the whole summary of a user from their recipes. rebuilds of a
+    user take turns on a lock of their row, with missing_only a summary built
+    by another request in the meantime is kept.
+    """
+    recipes = Recipe.objects.filter(user_id=user_id)
+    with transaction.atomic():
+        get_user_model().objects.lock(user_id)
+        if missing_only and is_materialized(user_id):
+            return
+        totals = recipes.aggregate(count=Count('id'), time_minutes=Sum('time_minutes'), price=Sum('price'))
+        RecipeStats.objects.update_or_create(user_id=user_id, defaults={
+            'recipe_count': totals['count'],
+            'time_minutes_sum': totals['time_minutes'] or 0,
+            'price_sum': totals['price'] or 0,
+        })
+
+        RecipeValueCount.objects.filter(user_id=user_id).delete()
+        RecipeValueCount.objects.bulk_create([
+            RecipeValueCount(user_id=user_id, field=field, value=value, count=count)
+            for field in VALUE_FIELDS
+            for value, count in recipes.order_by().values_list(field).annotate(count=Count('id'))
+        ])
+
+        AttrUsage.objects.filter(user_id=user_id).delete()
+        for model in ATTR_MODELS:
+            through, column = _relation(model)
+            usage = (
+                through.objects.filter(recipe__user_id=user_id)
+                .order_by().values_list(column).annotate(count=Count('id'))
+            )
+            AttrUsage.objects.bulk_create([
+                AttrUsage(user_id=user_id, model=model._meta.model_name, object_id=pk, count=count)
+                for pk, count in usage
+            ])
+
+
+def percentiles(histogram, total):
+    """nearest rank percentiles of a sorted [(value, count)] histogram"""
+    result = {}
+    ranks = [(p, max(1, -(-p * total // 100))) for p in PERCENTILES]
+    seen = 0
+    for value, count in histogram:
+        seen += count
+        while ranks and ranks[0][1] <= seen:
+            result[f'p{ranks.pop(0)[0]}'] = value
+    return result
+
+
+def _top(user_id, model, top):
+    usage = list(
+        AttrUsage.objects.filter(user_id=user_id, model=model._meta.model_name, count__gt=0)
+        .order_by('-count', 'object_id').values_list('object_id', 'count')[:top]
+    )
+    names = dict(model.objects.filter(pk__in=[pk for pk, _ in usage]).values_list('id', 'name'))
+    return [{'id': pk, 'name': names[pk], 'recipes': count} for pk, count in usage if pk in names]
+
+
+def summary(user_id, top=DEFAULT_TOP):
+    """the statistics of a user's recipes, read from the summary tables"""
+    stats = RecipeStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        rebuild(user_id, missing_only=True)
+        stats = RecipeStats.objects.get(user_id=user_id)
+
+    histograms = {field: [] for field in VALUE_FIELDS}
+    rows = RecipeValueCount.objects.filter(user_id=user_id, count__gt=0).order_by('field', 'value')
+    for field, value, count in rows.values_list('field', 'value', 'count'):
+        histograms[field].append((value, count))
+
+    total = stats.recipe_count
+    data = {'recipes': total}
+    sums = {'time_minutes': Decimal(stats.time_minutes_sum), 'price': stats.price_sum}
+    for field in VALUE_FIELDS:
+        histogram = histograms[field]
+        values = {
+            'avg': sums[field] / total if total else None,
+            'min': histogram[0][0] if histogram else None,
+            'max': histogram[-1][0] if histogram else None,
+        }
+        values.update(percentiles(histogram, total) if total else {f'p{p}': None for p in PERCENTILES})
+        data[field] = {key: _format(field, value) for key, value in values.items()}
+
+    data['top_tags'] = _top(user_id, Tag, top)
+    data['top_ingredients'] = _top(user_id, Ingredient, top)
+    return data
+
+
+def _format(field, value):
+    """minutes as numbers, prices as two decimal strings like RecipeSerializer"""
+    if value is None:
+        return None
+    if field == 'price':
+        return str(Decimal(value).quantize(Decimal('0.01')))
+    if value == value.to_integral_value():
+        return int(value)
+    return round(float(value), 2)
@@ -0,0 +1,77 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core.models import ChangeLogEntry, Ingredient, Recipe, Tag
+from recipe.serializers import IngredientSerializer, RecipeSerializer, TagSerializer
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+
+# response key and serializer per logged model, in the order clients should apply them
+SYNCED_MODELS = (
+    (Tag, 'tags', TagSerializer),
+    (Ingredient, 'ingredients', IngredientSerializer),
+    (Recipe, 'recipes', RecipeSerializer),
+)
+
+
+def record_changes(model, user_id, pks, action=ChangeLogEntry.UPSERT):
+    """
+    appends one change log entry per object. the ids are taken under a lock
+    on the user held to the end of the surrounding transaction, so entries of
+    a user become visible in id order and a cursor never skips one that
+    commits later with a lower id.
+    """
+    entries = [
+        ChangeLogEntry(user_id=user_id, model=model._meta.model_name, object_id=pk, action=action)
+        for pk in dict.fromkeys(pks)
+    ]
+    if not entries:
+        return
+    with transaction.atomic():
+        get_user_model().objects.lock(user_id)
+        ChangeLogEntry.objects.bulk_create(entries)
+
+
+def collapse(entries):
+    """the last action logged per object, keyed by model name"""
+    latest = {}
+    for model_name, object_id, action in entries:
+        latest.setdefault(model_name, {})[object_id] = action
+    return latest
+
+
+def changes_since(user, cursor, limit, context):
+    """
+    the changes of a user logged after cursor, at most limit entries. objects
+    are serialized as they are now, so an object changed several times is
+    sent once, and objects gone by now are sent as tombstones.
+    """
+    entries = list(
+        ChangeLogEntry.objects.filter(user=user, id__gt=cursor)
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'action')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    latest = collapse(entry[1:] for entry in entries)
+
+    changes = {}
+    for model, key, serializer_class in SYNCED_MODELS:
+        actions = latest.get(model._meta.model_name, {})
+        upserted = [pk for pk, action in actions.items() if action == ChangeLogEntry.UPSERT]
+        queryset = model.objects.filter(user=user, pk__in=upserted).order_by('id')
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            queryset = serializer_class.setup_eager_loading(queryset)
+        objects = list(queryset) if upserted else []
+        found = {obj.pk for obj in objects}
+        changes[key] = {
+            'upserted': serializer_class(objects, many=True, context=context).data,
+            'deleted': sorted(pk for pk in actions if pk not in found),
+        }
+
+    return {
+        'cursor': str(entries[-1][0] if entries else cursor),
+        'has_more': has_more,
+        'changes': changes,
+    }
@@ -0,0 +1,120 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, Tag, Ingredient
+from core.profiling import registry
+from recipe.async_views import shutdown_executor
+
+
+ROUTES = (
+    ('recipe:tag-list', 'recipe-async:tag-list'),
+    ('recipe:ingredient-list', 'recipe-async:ingredient-list'),
+    ('recipe:recipe-list', 'recipe-async:recipe-list'),
+)
+
+
+def sample_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def create_user_data(email):
+    user = get_user_model().objects.create_user(email, 'testpass12345')
+    recipe = sample_recipe(user, title='Soup')
+    recipe.tags.add(Tag.objects.create(user=user, name='Vegan'))
+    recipe.ingredients.add(Ingredient.objects.create(user=user, name='Salt'))
+    sample_recipe(user, title='Bread', price=2.50)
+    return user, recipe
+
+
+@override_settings(RECIPE_ASYNC_DB_EXECUTOR='sync')
+class AsyncReadApiTests(TestCase):
+    def setUp(self):
+        self.user, self.recipe = create_user_data('test@gmail.com')
+        create_user_data('other@gmail.com')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        # the async test client of django 3.2 takes extra arguments as raw header names
+        self.async_auth = {'authorization': f'Token {self.token.key}'}
+
+    async def test_auth_required(self):
+        for _, name in ROUTES:
+            response = await AsyncClient().get(reverse(name))
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_lists_match_sync_routes(self):
+        for sync_name, async_name in ROUTES:
+            expected = await self._sync_get(f'{reverse(sync_name)}?page_size=1')
+            response = await AsyncClient().get(f'{reverse(async_name)}?page_size=1', **self.async_auth)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], expected['Content-Type'])
+            self.assertEqual(response.json()['results'], expected.json()['results'])
+
+    async def test_detail_matches_sync_route(self):
+        expected = await self._sync_get(reverse('recipe:recipe-detail', args=[self.recipe.id]))
+        url = reverse('recipe-async:recipe-detail', args=[self.recipe.id])
+        response = await AsyncClient().get(url, **self.async_auth)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, expected.content)
+
+    async def test_detail_of_other_user_not_found(self):
+        other = await self._other_recipe_id()
+        response = await AsyncClient().get(reverse('recipe-async:recipe-detail', args=[other]), **self.async_auth)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_not_modified(self):
+        url = reverse('recipe-async:recipe-list')
+        response = await AsyncClient().get(url, **self.async_auth)
+        response = await AsyncClient().get(url, **{'if-none-match': response['ETag']}, **self.async_auth)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_writes_not_allowed(self):
+        response = await AsyncClient().post(reverse('recipe-async:tag-list'), {'name': 'Dessert'}, **self.async_auth)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def _sync_get(self, url):
+        return await sync_to_async(Client().get)(url, **self.auth)
+
+    async def _other_recipe_id(self):
+        return await sync_to_async(
+            lambda: Recipe.objects.exclude(user=self.user).values_list('id', flat=True).first()
+        )()
+
+
+@override_settings(RECIPE_ASYNC_DB_EXECUTOR='thread')
+class AsyncReadThreadPoolTests(TransactionTestCase):
+    def setUp(self):
+        # persistent connections of the database threads would outlive the test database
+        self.addCleanup(shutdown_executor)
+
+    def test_list_from_worker_thread(self):
+        user, _ = create_user_data('test@gmail.com')
+        token = Token.objects.create(user=user)
+
+        response = Client().get(reverse('recipe-async:recipe-list'), HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['title'] for item in response.json()], ['Bread', 'Soup'])
+
+    @override_settings(PROFILING=True)
+    def test_queries_of_worker_thread_profiled(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        user, _ = create_user_data('test@gmail.com')
+        token = Token.objects.create(user=user)
+
+        Client().get(reverse('recipe-async:recipe-list'), HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        self.assertGreater(registry.get('RecipeViewSet.list').queries, 0)
@@ -0,0 +1,114 @@
+import os
+import time
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.fastpath import FastRecipeSerializer
+from recipe.serializers import RecipeSerializer
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def render_standard(queryset):
+    return JSONRenderer().render(RecipeSerializer(RecipeSerializer.setup_eager_loading(queryset), many=True).data)
+
+
+def render_fast(queryset):
+    queryset = FastRecipeSerializer.setup_eager_loading(queryset)
+    return JSONRenderer().render(FastRecipeSerializer(queryset, many=True).data)
+
+
+def create_recipes(user, count, tags=3, ingredients=5):
+    tag_objs = [Tag.objects.create(user=user, name=f'Tag {i}') for i in range(tags)]
+    ingredient_objs = [Ingredient.objects.create(user=user, name=f'Ingredient {i}') for i in range(ingredients)]
+    recipes = []
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            user=user, title=f'Recipe {i} "quoted" é', time_minutes=i, price=Decimal(i % 1000) / 4,
+            link='https://example.com/' if i % 2 else '',
+        )
+        recipe.tags.add(*tag_objs[:i % (tags + 1)])
+        recipe.ingredients.add(*reversed(ingredient_objs[:i % (ingredients + 1)]))
+        recipes.append(recipe)
+    return recipes
+
+
+class FastRecipeSerializerParityTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+
+    def test_identical_json(self):
+        create_recipes(self.user, 12)
+        queryset = Recipe.objects.filter(user=self.user).order_by('-id')
+        self.assertEqual(render_fast(queryset), render_standard(queryset))
+
+    def test_identical_json_for_prices(self):
+        for price in ('0', '5', '5.5', '0.01', '999.99'):
+            Recipe.objects.create(user=self.user, title=price, time_minutes=1, price=Decimal(price))
+        queryset = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(render_fast(queryset), render_standard(queryset))
+
+    def test_empty(self):
+        queryset = Recipe.objects.none()
+        self.assertEqual(render_fast(queryset), b'[]')
+
+    def test_query_count(self):
+        create_recipes(self.user, 10)
+        queryset = Recipe.objects.filter(user=self.user).order_by('-id')
+        # postgres aggregates the ids in the recipe query, elsewhere each through table is read once
+        with self.assertNumQueries(1 if connection.vendor == 'postgresql' else 3):
+            FastRecipeSerializer(FastRecipeSerializer.setup_eager_loading(queryset), many=True).data
+
+
+@override_settings(RECIPE_FAST_LIST=True)
+class FastRecipeListApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+        self.recipes = create_recipes(self.user, 7)
+
+    def _get_both(self, params):
+        fast = self.client.get(RECIPES_URL, params)
+        with override_settings(RECIPE_FAST_LIST=False):
+            standard = self.client.get(RECIPES_URL, params)
+        self.assertEqual(fast.status_code, standard.status_code)
+        return fast, standard
+
+    def test_list_identical(self):
+        fast, standard = self._get_both({})
+        self.assertEqual(fast.content, standard.content)
+
+    def test_keyset_pages_identical(self):
+        fast, standard = self._get_both({'page_size': 3})
+        self.assertEqual(fast.content, standard.content)
+        fast, standard = self._get_both({'page_size': 3, 'cursor': fast.data['next'].split('cursor=')[1]})
+        self.assertEqual(fast.content, standard.content)
+
+    def test_filters_identical(self):
+        tag = Tag.objects.get(user=self.user, name='Tag 0')
+        fast, standard = self._get_both({'tags': tag.id, 'q': 'recipe'})
+        self.assertEqual(fast.content, standard.content)
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class FastRecipeSerializerBenchmark(TestCase):
+    def test_benchmark(self):
+        user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        create_recipes(user, 2000, tags=10, ingredients=20)
+        queryset = Recipe.objects.filter(user=user).order_by('-id')
+        for name, render in (('serializer', render_standard), ('fast path', render_fast)):
+            started = time.perf_counter()
+            for _ in range(5):
+                render(queryset)
+            print(f'\n{name}: {(time.perf_counter() - started) / 5 * 1000:.1f}ms per 2000 recipes')
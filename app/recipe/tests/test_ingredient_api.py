@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 from django.test import TestCase
 
@@ -24,6 +25,7 @@ class PublicIngredientsApiTests(TestCase):
 
 class PrivateIngredientsApiTests(TestCase):
     def setUp(self) -> None:
+        cache.clear()
         self.user = get_user_model().objects.create_user(
             email='test@gmail.com',
             password='testTEST12345',
@@ -1,16 +1,25 @@
+import base64
+import json
 import tempfile
 import os
+import unittest
+from unittest.mock import patch
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Tag, Ingredient
+from core.models import ChangeLogEntry, CollectionVersion, Recipe, RecipeStats, Tag, Ingredient
+from recipe import similarity, stats
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 
@@ -201,6 +210,65 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn('image', response.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    @override_settings(RECIPE_IMAGE_PROCESSING='sync')
+    def test_upload_image_generates_variants_without_exif(self):
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', (800, 400))
+            exif = Image.Exif()
+            exif[0x010f] = 'Test Camera'
+            img.save(ntf, format='JPEG', exif=exif)
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {'image': ntf})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['image_variants'], {})
+
+        self.recipe.refresh_from_db()
+        variants = self.recipe.image_variants
+        self.assertEqual(set(variants), {'thumbnail', 'medium'})
+        try:
+            with default_storage.open(variants['thumbnail']['jpg']) as thumbnail:
+                with Image.open(thumbnail) as image:
+                    self.assertEqual(image.size, (100, 50))
+                    self.assertEqual(len(image.getexif()), 0)
+        finally:
+            for names in variants.values():
+                for name in names.values():
+                    default_storage.delete(name)
+
+    def _jpeg(self, size=(10, 10), color='red'):
+        ntf = tempfile.NamedTemporaryFile(suffix='.jpg')
+        Image.new('RGB', size, color).save(ntf, format='JPEG')
+        ntf.seek(0)
+        return ntf
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=100)
+    def test_upload_image_over_byte_limit(self):
+        with self._jpeg() as ntf:
+            response = self.client.post(image_upload_url(self.recipe.id), {'image': ntf})
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIDE=5)
+    def test_upload_image_over_dimension_limit(self):
+        with self._jpeg() as ntf:
+            response = self.client.post(image_upload_url(self.recipe.id), {'image': ntf})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.data)
+
+    def test_identical_uploads_share_a_file(self):
+        other = sample_recipe(user=self.user, title='Other')
+        for recipe in (self.recipe, other):
+            with self._jpeg() as ntf:
+                response = self.client.post(image_upload_url(recipe.id), {'image': ntf})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, other.image.name)
+        self.assertEqual(self.recipe.image.name, f'uploads/recipe/{self.recipe.image_hash}.jpg')
+
     def test_upload_image_bad_request(self):
         url = image_upload_url(self.recipe.id)
         response = self.client.post(url, {'image': 'badimage'})
@@ -249,3 +317,688 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn(serializer1.data, response.data)
         self.assertIn(serializer2.data, response.data)
         self.assertNotIn(serializer3.data, response.data)
+
+
+class RecipeQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+        cache.clear()
+        CollectionVersion.objects.current(self.user.pk)
+
+    def _create_recipes(self, count):
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        for i in range(count):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+        return recipe
+
+    def test_list_query_count_is_constant(self):
+        # recipes, tags and ingredients, plus the collection version for the etag
+        self._create_recipes(1)
+        with self.assertNumQueries(4):
+            response = self.client.get(RECIPES_URL)
+        self.assertEqual(len(response.data), 1)
+
+        self._create_recipes(10)
+        with self.assertNumQueries(4):
+            response = self.client.get(RECIPES_URL)
+        self.assertEqual(len(response.data), 11)
+
+    def test_detail_query_count(self):
+        recipe = self._create_recipes(1)
+        recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+        # the updated_at lookup for the etag comes first
+        with self.assertNumQueries(4):
+            response = self.client.get(detail_url(recipe.id))
+        self.assertEqual(len(response.data['tags']), 2)
+
+
+class RecipePaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+
+    def test_unpaginated_by_default(self):
+        sample_recipe(user=self.user)
+        response = self.client.get(RECIPES_URL)
+        self.assertIsInstance(response.data, list)
+
+    def test_keyset_pages_cover_all_recipes_once(self):
+        recipes = [sample_recipe(user=self.user, title=f'Recipe {i}') for i in range(5)]
+        response = self.client.get(RECIPES_URL, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+        self.assertEqual(seen, [recipe.id for recipe in reversed(recipes)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_of_wrong_type(self):
+        sample_recipe(user=self.user)
+        for position in (['abc'], [{}], [None], [True]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+            response = self.client.get(RECIPES_URL, {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, position)
+
+
+class RecipeFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.dessert = sample_tag(user=self.user, name='Dessert')
+
+    def test_recipe_matching_several_tags_returned_once(self):
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(self.vegan, self.dessert)
+        response = self.client.get(RECIPES_URL, {'tags': f'{self.vegan.id},{self.dessert.id}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [recipe.id])
+
+    def test_match_all_tags(self):
+        both = sample_recipe(user=self.user, title='Vegan cake')
+        both.tags.add(self.vegan, self.dessert)
+        only_vegan = sample_recipe(user=self.user, title='Salad')
+        only_vegan.tags.add(self.vegan)
+        response = self.client.get(RECIPES_URL, {
+            'tags': f'{self.vegan.id},{self.dessert.id}',
+            'match': 'all',
+        })
+        self.assertEqual([item['id'] for item in response.data], [both.id])
+
+    def test_match_all_across_tags_and_ingredients(self):
+        salt = sample_ingredient(user=self.user, name='Salt')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(self.vegan)
+        recipe.ingredients.add(salt)
+        other = sample_recipe(user=self.user)
+        other.tags.add(self.vegan)
+        response = self.client.get(RECIPES_URL, {
+            'tags': f'{self.vegan.id}',
+            'ingredients': f'{salt.id}',
+            'match': 'all',
+        })
+        self.assertEqual([item['id'] for item in response.data], [recipe.id])
+
+    def test_invalid_filter_params(self):
+        response = self.client.get(RECIPES_URL, {'tags': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(RECIPES_URL, {'tags': f'{self.vegan.id}', 'match': 'some'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+BULK_URL = reverse('recipe:recipe-bulk')
+
+
+class RecipeBulkApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+
+    def _payload(self, count):
+        return [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': '5.00',
+                'tags': [self.tag.id],
+                'ingredients': [self.ingredient.id],
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create(self):
+        response = self.client.post(BULK_URL, self._payload(3), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 3)
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        for recipe in recipes:
+            self.assertEqual(list(recipe.tags.all()), [self.tag])
+            self.assertEqual(list(recipe.ingredients.all()), [self.ingredient])
+
+    def test_bulk_create_resolves_related_ids_once(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(BULK_URL, self._payload(5), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        statements = [query['sql'] for query in context.captured_queries]
+        tag_lookups = [sql for sql in statements if sql.startswith('SELECT') and 'FROM "core_tag" WHERE' in sql]
+        self.assertEqual(len(tag_lookups), 1)
+        through_inserts = [sql for sql in statements if sql.startswith('INSERT INTO "core_recipe_tags"')]
+        self.assertEqual(len(through_inserts), 1)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testpass12345')
+        other_tag = sample_tag(user=other_user)
+        payload = self._payload(3)
+        payload[1]['tags'] = [other_tag.id]
+        del payload[2]['title']
+
+        response = self.client.post(BULK_URL, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('title', response.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+        del payload[2]
+        response = self.client.post(BULK_URL, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', response.data[1])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update(self):
+        recipe1 = sample_recipe(user=self.user)
+        recipe1.tags.add(self.tag)
+        recipe2 = sample_recipe(user=self.user)
+        new_tag = sample_tag(user=self.user, name='Vegan')
+        payload = [
+            {'id': recipe1.id, 'title': 'Updated', 'tags': [new_tag.id]},
+            {'id': recipe2.id, 'time_minutes': 45},
+        ]
+        response = self.client.patch(BULK_URL, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.title, 'Updated')
+        self.assertEqual(list(recipe1.tags.all()), [new_tag])
+        self.assertEqual(recipe2.time_minutes, 45)
+
+    def test_bulk_update_unknown_id(self):
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testpass12345')
+        other_recipe = sample_recipe(user=other_user)
+        response = self.client.patch(BULK_URL, [{'id': other_recipe.id, 'title': 'Mine'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('id', response.data[0])
+
+    def test_bulk_delete(self):
+        recipe1 = sample_recipe(user=self.user)
+        recipe2 = sample_recipe(user=self.user)
+        keep = sample_recipe(user=self.user)
+        response = self.client.delete(BULK_URL, {'ids': [recipe1.id, recipe2.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(list(Recipe.objects.all()), [keep])
+
+        response = self.client.delete(BULK_URL, {'ids': [keep.id, recipe1.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Recipe.objects.filter(id=keep.id).exists())
+
+    def _delete_queries(self, count):
+        tag = sample_tag(user=self.user)
+        recipes = [sample_recipe(user=self.user) for _ in range(count)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(BULK_URL, {'ids': [recipe.id for recipe in recipes]}, format='json')
+        self.assertEqual(response.data['deleted'], count)
+        return len(queries)
+
+    def test_bulk_delete_query_count_independent_of_size(self):
+        self.assertEqual(self._delete_queries(2), self._delete_queries(10))
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+
+    def test_bulk_delete_tags_updates_recipes(self):
+        tag = sample_tag(user=self.user)
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+        cursor = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first()
+
+        response = self.client.delete(reverse('recipe:tag-bulk'), {'ids': [tag.id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Tag.objects.filter(id=tag.id).exists())
+        self.assertEqual(list(recipe.tags.all()), [])
+        logged = ChangeLogEntry.objects.filter(id__gt=cursor).values_list('model', 'object_id', 'action')
+        self.assertEqual(set(logged), {('tag', tag.id, 'delete'), ('recipe', recipe.id, 'upsert')})
+
+
+class RecipeRelatedFieldTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+
+    def _payload(self, ingredients):
+        return {
+            'title': 'Stew',
+            'time_minutes': 60,
+            'price': '12.00',
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'tags': [],
+        }
+
+    def test_create_query_count_independent_of_ingredient_count(self):
+        few = [sample_ingredient(user=self.user, name=f'Few {i}') for i in range(1)]
+        many = [sample_ingredient(user=self.user, name=f'Many {i}') for i in range(30)]
+        with CaptureQueriesContext(connection) as few_queries:
+            self.client.post(RECIPES_URL, self._payload(few), format='json')
+        with CaptureQueriesContext(connection) as many_queries:
+            response = self.client.post(RECIPES_URL, self._payload(many), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(few_queries), len(many_queries))
+        self.assertEqual(Recipe.objects.get(id=response.data['id']).ingredients.count(), 30)
+
+    def test_missing_and_foreign_ids_reported_together(self):
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testpass12345')
+        foreign = sample_ingredient(user=other_user)
+        own = sample_ingredient(user=self.user)
+        payload = self._payload([own])
+        payload['ingredients'] += [foreign.id, 999999]
+        response = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['ingredients']), 2)
+        self.assertIn(str(foreign.id), response.data['ingredients'][0])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_invalid_pk_type(self):
+        payload = self._payload([])
+        payload['ingredients'] = ['abc']
+        response = self.client.post(RECIPES_URL, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+        self.curry = sample_recipe(user=self.user, title='Thai Vegetable Curry')
+        self.salmon = sample_recipe(user=self.user, title='Grilled Fish')
+        self.salmon.ingredients.add(sample_ingredient(user=self.user, name='Salmon'))
+        self.cake = sample_recipe(user=self.user, title='Chocolate Cake')
+        self.cake.tags.add(sample_tag(user=self.user, name='Dessert'))
+
+    def _search(self, terms):
+        response = self.client.get(RECIPES_URL, {'q': terms})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data]
+
+    def test_search_by_title(self):
+        self.assertEqual(self._search('curry'), [self.curry.id])
+
+    def test_search_by_tag_and_ingredient_names(self):
+        self.assertEqual(self._search('dessert'), [self.cake.id])
+        self.assertEqual(self._search('salmon'), [self.salmon.id])
+
+    def test_search_follows_renamed_tags(self):
+        tag = self.cake.tags.get()
+        tag.name = 'Baking'
+        tag.save()
+        self.assertEqual(self._search('dessert'), [])
+        self.assertEqual(self._search('baking'), [self.cake.id])
+
+    def test_search_limited_to_user(self):
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testpass12345')
+        sample_recipe(user=other_user, title='Green Curry')
+        self.assertEqual(self._search('curry'), [self.curry.id])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'ranking needs postgres')
+    def test_ranked_pages_follow_rank_order(self):
+        titles = ('Curry', 'Curry', 'Red Curry Soup', 'Quick Green Curry Bowl with Rice', 'Curry Curry Noodles')
+        for title in titles:
+            sample_recipe(user=self.user, title=title)
+        ranked = self._search('curry')
+
+        response = self.client.get(RECIPES_URL, {'q': 'curry', 'page_size': 1})
+        seen = [item['id'] for item in response.data['results']]
+        # bounded, a cursor that does not move past its row repeats pages forever
+        while response.data['next'] and len(seen) <= len(ranked):
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+
+        self.assertEqual(len(ranked), len(titles) + 1)
+        self.assertEqual(seen, ranked)
+
+
+class RecipeConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.tag = sample_tag(user=self.user)
+        self.recipe.tags.add(self.tag)
+
+    def test_list_etag_not_modified(self):
+        response = self.client.get(RECIPES_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # only the collection version is read
+        with self.assertNumQueries(1):
+            response = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_list_etag_changes_with_collection(self):
+        etag = self.client.get(RECIPES_URL)['ETag']
+        sample_recipe(user=self.user, title='Another recipe')
+
+        response = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 2)
+
+    def test_list_etag_sees_version_bumped_elsewhere(self):
+        etag = self.client.get(RECIPES_URL)['ETag']
+        # as another worker would, without touching this process' caches
+        CollectionVersion.objects.bump(self.user.id)
+
+        response = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_etag_depends_on_query(self):
+        etag = self.client.get(RECIPES_URL)['ETag']
+        response = self.client.get(RECIPES_URL, {'tags': self.tag.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_detail_etag_changes_on_tag_rename(self):
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        self.tag.name = 'Renamed'
+        self.tag.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tags'][0]['name'], 'Renamed')
+
+    def test_detail_etag_changes_on_membership_change(self):
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+        self.recipe.ingredients.add(sample_ingredient(user=self.user))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_detail_if_modified_since(self):
+        url = detail_url(self.recipe.id)
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_of_other_user_not_found(self):
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testpass12345')
+        recipe = sample_recipe(user=other_user)
+        response = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
+
+    def test_detail_malformed_pk_not_found(self):
+        response = self.client.get(detail_url('abc'), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class RecipeExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+
+    def _export(self, **params):
+        response = self.client.get(EXPORT_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b''.join(response.streaming_content)
+
+    def test_export_json(self):
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testpass12345')
+        sample_recipe(user=other_user)
+
+        response, content = self._export()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        expected = RecipeDetailSerializer(Recipe.objects.filter(user=self.user), many=True).data
+        self.assertEqual(json.loads(content), json.loads(json.dumps(expected)))
+
+    def test_export_empty(self):
+        _, content = self._export()
+        self.assertEqual(json.loads(content), [])
+
+    def test_export_ndjson_in_chunks(self):
+        recipes = [sample_recipe(user=self.user, title=f'Recipe {i}') for i in range(5)]
+        with patch('recipe.export.CHUNK_SIZE', 2):
+            response, content = self._export(output='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = content.decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [recipe.id for recipe in recipes])
+
+    def test_export_applies_filters(self):
+        recipe = sample_recipe(user=self.user, title='Tagged')
+        tag = sample_tag(user=self.user)
+        recipe.tags.add(tag)
+        sample_recipe(user=self.user, title='Untagged')
+        _, content = self._export(tags=tag.id)
+        self.assertEqual([item['id'] for item in json.loads(content)], [recipe.id])
+
+    def test_export_invalid_output(self):
+        response = self.client.get(EXPORT_URL, {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+STATS_URL = reverse('recipe:recipe-stats')
+
+
+class RecipeStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+
+    def _stats(self, **params):
+        response = self.client.get(STATS_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def _assert_matches_rebuild(self):
+        """the incrementally maintained summary equals one built from scratch"""
+        maintained = self._stats()
+        RecipeStats.objects.filter(user=self.user).delete()
+        self.assertEqual(maintained, self._stats())
+
+    def test_empty(self):
+        data = self._stats()
+        self.assertEqual(data['recipes'], 0)
+        self.assertEqual(data['price']['avg'], None)
+        self.assertEqual(data['top_tags'], [])
+
+    def test_stats(self):
+        vegan = sample_tag(user=self.user, name='Vegan')
+        dessert = sample_tag(user=self.user, name='Dessert')
+        for minutes, price in ((10, '2.00'), (20, '4.00'), (30, '6.50'), (40, '8.00')):
+            recipe = sample_recipe(user=self.user, time_minutes=minutes, price=price)
+            recipe.tags.add(vegan)
+        recipe.tags.add(dessert)
+        sample_recipe(user=get_user_model().objects.create_user('other@gmail.com', 'testpass12345'))
+
+        data = self._stats()
+        self.assertEqual(data['recipes'], 4)
+        self.assertEqual(data['time_minutes'], {'avg': 25, 'min': 10, 'max': 40, 'p50': 20, 'p90': 40, 'p99': 40})
+        self.assertEqual(data['price']['avg'], '5.12')
+        self.assertEqual(data['price']['p50'], '4.00')
+        self.assertEqual(data['top_tags'], [
+            {'id': vegan.id, 'name': 'Vegan', 'recipes': 4},
+            {'id': dessert.id, 'name': 'Dessert', 'recipes': 1},
+        ])
+        self.assertEqual(len(self._stats(top=1)['top_tags']), 1)
+
+    def test_stats_follow_changes(self):
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        recipe = sample_recipe(user=self.user, time_minutes=10, price='5.00')
+        recipe.tags.add(tag)
+        self._stats()
+
+        other = sample_recipe(user=self.user, time_minutes=30, price='1.00')
+        other.ingredients.add(ingredient)
+        other.tags.add(tag)
+        recipe.price = '7.25'
+        recipe.save()
+        self.client.patch(detail_url(recipe.id), {'tags': [], 'ingredients': [ingredient.id]}, format='json')
+        tag.recipe_set.remove(recipe, other)
+        self._assert_matches_rebuild()
+
+        other.delete()
+        sample_tag(user=self.user, name='Unused').delete()
+        ingredient.recipe_set.clear()
+        self._assert_matches_rebuild()
+
+    def test_stats_follow_bulk_changes(self):
+        self._stats()
+        payload = [{'title': 'Soup', 'time_minutes': 15, 'price': '3.00', 'tags': []}]
+        response = self.client.post(reverse('recipe:recipe-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._stats()['recipes'], 1)
+        self._assert_matches_rebuild()
+
+        recipe_id = Recipe.objects.get().id
+        response = self.client.delete(reverse('recipe:recipe-bulk'), {'ids': [recipe_id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._stats()['recipes'], 0)
+        self._assert_matches_rebuild()
+
+    def test_bulk_create_applied_without_rebuild(self):
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        sample_recipe(user=self.user, time_minutes=15, price='3.00').tags.add(tag)
+        self._stats()
+
+        payload = [
+            {'title': 'Soup', 'time_minutes': 15, 'price': '3.00', 'tags': [tag.id], 'ingredients': [ingredient.id]},
+            {'title': 'Stew', 'time_minutes': 90, 'price': '12.40', 'tags': [tag.id]},
+        ]
+        with patch('recipe.stats.rebuild') as rebuild:
+            response = self.client.post(reverse('recipe:recipe-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        rebuild.assert_not_called()
+        self.assertEqual(self._stats()['top_tags'][0]['recipes'], 3)
+        self._assert_matches_rebuild()
+
+    def test_bulk_delete_applied_without_rebuild(self):
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        kept = sample_recipe(user=self.user, time_minutes=15, price='3.00')
+        kept.tags.add(tag)
+        recipes = [sample_recipe(user=self.user, time_minutes=15 * index, price='3.00') for index in (1, 2)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+        self._stats()
+
+        with patch('recipe.stats.rebuild') as rebuild:
+            response = self.client.delete(BULK_URL, {'ids': [recipe.id for recipe in recipes]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rebuild.assert_not_called()
+        data = self._stats()
+        self.assertEqual((data['recipes'], data['top_tags'][0]['recipes']), (1, 1))
+        self.assertEqual(data['top_ingredients'], [])
+        self._assert_matches_rebuild()
+
+    def test_delete_reads_links_once(self):
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user), sample_tag(user=self.user, name='Vegan'))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+        self._stats()
+        with CaptureQueriesContext(connection) as queries:
+            recipe.delete()
+        links = [query for query in queries if 'recipe_tags' in query['sql'] and 'recipe_ingredients' in query['sql']]
+        self.assertEqual(len(links), 1)
+        self._assert_matches_rebuild()
+
+    def test_first_read_builds_once(self):
+        sample_recipe(user=self.user)
+        stats.rebuild(self.user.id)
+        with patch('recipe.stats.RecipeStats.objects.update_or_create') as build:
+            stats.rebuild(self.user.id, missing_only=True)
+        build.assert_not_called()
+        self.assertEqual(self._stats()['recipes'], 1)
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+class RecipeSimilarTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.dinner = sample_tag(user=self.user, name='Dinner')
+        self.rice = sample_ingredient(user=self.user, name='Rice')
+        self.curry = self._recipe('Curry', [self.vegan, self.dinner], [self.rice])
+
+    def _recipe(self, title, tags, ingredients):
+        recipe = sample_recipe(user=self.user, title=title)
+        recipe.tags.add(*tags)
+        recipe.ingredients.add(*ingredients)
+        return recipe
+
+    def _similar(self, recipe, **params):
+        response = self.client.get(similar_url(recipe.id), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['id'], item['similarity']) for item in response.data]
+
+    def test_similar_ranked_by_jaccard(self):
+        dal = self._recipe('Dal', [self.vegan, self.dinner], [self.rice])
+        salad = self._recipe('Salad', [self.vegan], [])
+        self._recipe('Steak', [self.dinner], [sample_ingredient(user=self.user, name='Beef')])
+        self._recipe('Toast', [], [])
+
+        results = self._similar(self.curry)
+        self.assertEqual(results[:2], [(dal.id, 1.0), (salad.id, 0.3333)])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(self._similar(self.curry, limit=1)), 1)
+
+    def test_similar_follows_membership_changes(self):
+        salad = self._recipe('Salad', [], [])
+        self.assertEqual(self._similar(self.curry), [])
+        salad.tags.add(self.vegan)
+        self.assertEqual(self._similar(self.curry), [(salad.id, 0.3333)])
+        self.vegan.delete()
+        self.assertEqual(self._similar(self.curry), [])
+
+    def test_similar_index_expires(self):
+        salad = self._recipe('Salad', [], [])
+        with patch.object(similarity.index_cache, 'ttl', 0):
+            self.assertEqual(self._similar(self.curry), [])
+        # linked by another worker, whose version bump never reaches this process
+        Recipe.tags.through.objects.create(recipe=salad, tag=self.vegan)
+        self.assertEqual(self._similar(self.curry), [(salad.id, 0.3333)])
+
+    def test_similar_limited_to_user(self):
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testpass12345')
+        other_recipe = sample_recipe(user=other_user)
+        response = self.client.get(similar_url(other_recipe.id))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @unittest.skipUnless(similarity.sparse, 'scipy is not installed')
+    def test_matrix_and_postings_agree(self):
+        links = [(self.curry.id, ('t', 1)), (self.curry.id, ('i', 2))]
+        links += [(pk, ('t', pk % 3)) for pk in range(100, 200)]
+        recipe_ids = [self.curry.id] + list(range(100, 200))
+        matrix = similarity.SimilarityIndex(recipe_ids, links).similar(self.curry.id, 20)
+        with patch.object(similarity, 'sparse', None):
+            postings = similarity.SimilarityIndex(recipe_ids, links).similar(self.curry.id, 20)
+        self.assertEqual([pk for pk, _ in matrix], [pk for pk, _ in postings])
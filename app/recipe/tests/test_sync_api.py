@@ -0,0 +1,136 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from unittest import skipUnless
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ChangeLogEntry, Recipe, Tag, Ingredient
+
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def sample_recipe(user, **params):
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicSyncApiTests(TestCase):
+    def test_auth_required(self):
+        response = APIClient().get(SYNC_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateSyncApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testpass12345')
+        self.client.force_authenticate(self.user)
+
+    def _sync(self, **params):
+        response = self.client.get(SYNC_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_initial_sync_returns_everything(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(tag)
+
+        data = self._sync()
+        self.assertFalse(data['has_more'])
+        self.assertEqual(data['changes']['tags']['upserted'], [{'id': tag.id, 'name': 'Vegan'}])
+        recipes = data['changes']['recipes']['upserted']
+        self.assertEqual([item['id'] for item in recipes], [recipe.id])
+        self.assertEqual(recipes[0]['tags'], [tag.id])
+        self.assertEqual(data['changes']['recipes']['deleted'], [])
+
+    def test_changes_since_cursor(self):
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        cursor = self._sync()['cursor']
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        ingredient_id = ingredient.id
+        ingredient.delete()
+        data = self._sync(cursor=cursor)
+        self.assertEqual(data['changes']['tags']['upserted'], [{'id': tag.id, 'name': 'Vegetarian'}])
+        self.assertEqual(data['changes']['ingredients'], {'upserted': [], 'deleted': [ingredient_id]})
+        self.assertEqual(data['changes']['recipes'], {'upserted': [], 'deleted': []})
+
+        data = self._sync(cursor=data['cursor'])
+        self.assertEqual(data['changes']['tags'], {'upserted': [], 'deleted': []})
+
+    def test_membership_change_logs_recipe(self):
+        recipe = sample_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        cursor = self._sync()['cursor']
+
+        tag_id = tag.id
+        tag.delete()
+        data = self._sync(cursor=cursor)
+        self.assertEqual(data['changes']['tags']['deleted'], [tag_id])
+        self.assertEqual(data['changes']['recipes']['upserted'][0]['tags'], [])
+
+    def test_created_and_deleted_between_syncs_is_a_tombstone(self):
+        cursor = self._sync()['cursor']
+        recipe = sample_recipe(user=self.user)
+        recipe_id = recipe.id
+        recipe.delete()
+        data = self._sync(cursor=cursor)
+        self.assertEqual(data['changes']['recipes'], {'upserted': [], 'deleted': [recipe_id]})
+
+    def test_paging(self):
+        tags = [Tag.objects.create(user=self.user, name=f'Tag {i}') for i in range(5)]
+        seen = []
+        data = self._sync(limit=2)
+        seen.extend(item['id'] for item in data['changes']['tags']['upserted'])
+        while data['has_more']:
+            data = self._sync(cursor=data['cursor'], limit=2)
+            seen.extend(item['id'] for item in data['changes']['tags']['upserted'])
+        self.assertEqual(seen, [tag.id for tag in tags])
+
+    def test_bulk_changes_logged(self):
+        cursor = self._sync()['cursor']
+        response = self.client.post(
+            reverse('recipe:tag-bulk'), [{'name': 'Vegan'}, {'name': 'Dessert'}], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = self._sync(cursor=cursor)
+        self.assertEqual(len(data['changes']['tags']['upserted']), 2)
+
+    def test_limited_to_user(self):
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testpass12345')
+        sample_recipe(user=other_user)
+        data = self._sync()
+        self.assertEqual(data['changes']['recipes'], {'upserted': [], 'deleted': []})
+
+    def test_invalid_cursor(self):
+        response = self.client.get(SYNC_URL, {'cursor': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @skipUnless(connection.features.has_select_for_update, 'needs select_for_update')
+    def test_appends_lock_the_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            sample_recipe(user=self.user)
+        statements = [query['sql'] for query in queries]
+        lock = next(index for index, sql in enumerate(statements) if 'FOR UPDATE' in sql)
+        insert = next(index for index, sql in enumerate(statements) if 'INSERT INTO "core_changelogentry"' in sql)
+        self.assertIn('"core_user"', statements[lock])
+        self.assertLess(lock, insert)
+
+    def test_user_delete_purges_log(self):
+        sample_recipe(user=self.user)
+        self.user.delete()
+        self.assertFalse(ChangeLogEntry.objects.exists())
@@ -1,15 +1,21 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
+from django.db import connection
 from django.test import TestCase
+from unittest import skipUnless
+from unittest.mock import patch
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag, Recipe
+from core.models import CollectionVersion, Tag, Recipe
+from recipe.autocomplete import trie_cache
 from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 class PublicTagsApiTests(TestCase):
@@ -24,6 +30,7 @@ class PublicTagsApiTests(TestCase):
 
 class PrivateTagsApiTests(TestCase):
     def setUp(self) -> None:
+        cache.clear()
         self.user = get_user_model().objects.create_user(
             email='test@gmail.com',
             password='testTEST12345',
@@ -94,3 +101,164 @@ class PrivateTagsApiTests(TestCase):
         serializer2 = TagSerializer(tag2)
         self.assertIn(serializer1.data, response.data)
         self.assertNotIn(serializer2.data, response.data)
+
+    def test_keyset_pages_with_duplicate_names(self):
+        tags = [Tag.objects.create(user=self.user, name=name) for name in ('Vegan', 'Dessert', 'Vegan', 'Vegan')]
+        response = self.client.get(TAGS_URL, {'page_size': 2})
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+        self.assertEqual(seen, [tags[0].id, tags[2].id, tags[3].id, tags[1].id])
+
+    def test_tag_list_served_from_cache(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+        # only the collection version is read, once for the ETag and the cache key
+        with self.assertNumQueries(1):
+            response = self.client.get(TAGS_URL)
+        self.assertEqual(len(response.data), 1)
+
+    def test_tag_list_cache_follows_writes_elsewhere(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+        # as another worker would, without touching this process' caches
+        Tag.objects.bulk_create([Tag(user=self.user, name='Dessert')])
+        CollectionVersion.objects.bump(self.user.id)
+
+        response = self.client.get(TAGS_URL)
+        self.assertEqual(sorted(item['name'] for item in response.data), ['Dessert', 'Vegan'])
+        # the new etag goes with the new body
+        response = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_tag_list_not_modified(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+        response = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        payload = [{'id': Tag.objects.get().id, 'name': 'Vegetarian'}]
+        self.client.patch(reverse('recipe:tag-bulk'), payload, format='json')
+        response = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['name'], 'Vegetarian')
+
+    def test_cache_invalidated_on_create(self):
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+        self.client.post(TAGS_URL, {'name': 'Dessert'})
+        response = self.client.get(TAGS_URL)
+        self.assertEqual([item['name'] for item in response.data], ['Vegan', 'Dessert'])
+
+    def test_assigned_only_cache_invalidated_on_membership_change(self):
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(title='Eggs', time_minutes=5, price=5.00, user=self.user)
+        response = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(response.data), 0)
+
+        recipe.tags.add(tag)
+        response = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(response.data), 1)
+
+        recipe.delete()
+        response = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(response.data), 0)
+
+    def test_assigned_only_returns_unique_tags(self):
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        for title in ('Eggs', 'Toast'):
+            recipe = Recipe.objects.create(title=title, time_minutes=5, price=5.00, user=self.user)
+            recipe.tags.add(tag)
+        response = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual([item['id'] for item in response.data], [tag.id])
+
+    def test_with_counts_and_usage_ordering(self):
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dessert = Tag.objects.create(user=self.user, name='Dessert')
+        unused = Tag.objects.create(user=self.user, name='Unused')
+        for title in ('Cake', 'Pie'):
+            recipe = Recipe.objects.create(title=title, time_minutes=5, price=5.00, user=self.user)
+            recipe.tags.add(dessert)
+        recipe.tags.add(vegan)
+
+        response = self.client.get(TAGS_URL, {'with_counts': 1})
+        self.assertEqual(response.data, [
+            {'id': vegan.id, 'name': 'Vegan', 'recipe_count': 1},
+            {'id': unused.id, 'name': 'Unused', 'recipe_count': 0},
+            {'id': dessert.id, 'name': 'Dessert', 'recipe_count': 2},
+        ])
+
+        response = self.client.get(TAGS_URL, {'ordering': 'usage', 'page_size': 2})
+        self.assertEqual([item['id'] for item in response.data['results']], [dessert.id, vegan.id])
+        self.assertNotIn('recipe_count', response.data['results'][0])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [unused.id])
+
+    def test_invalid_ordering(self):
+        response = self.client.get(TAGS_URL, {'ordering': 'created'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_and_update_tags(self):
+        url = reverse('recipe:tag-bulk')
+        response = self.client.post(url, [{'name': 'Vegan'}, {'name': 'Dessert'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+        tag_id = response.data[0]['id']
+        response = self.client.patch(url, [{'id': tag_id, 'name': 'Vegetarian'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Tag.objects.get(id=tag_id).name, 'Vegetarian')
+
+        response = self.client.get(TAGS_URL)
+        self.assertIn('Vegetarian', [item['name'] for item in response.data])
+
+
+class TagAutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('test@gmail.com', 'testTEST12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for name in ('Vegetarian', 'Vegan', 'Dessert', 'vegetable'):
+            Tag.objects.create(user=self.user, name=name)
+
+    def _names(self, params):
+        response = self.client.get(AUTOCOMPLETE_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in response.data]
+
+    def test_prefix_completion(self):
+        self.assertEqual(self._names({'prefix': 'veg'}), ['Vegan', 'vegetable', 'Vegetarian'])
+        self.assertEqual(self._names({'prefix': 'VEG', 'limit': 1}), ['Vegan'])
+        self.assertEqual(self._names({'prefix': 'xyz'}), [])
+
+    def test_prefix_trie_cached_and_invalidated(self):
+        self._names({'prefix': 'veg'})
+        with self.assertNumQueries(0):
+            self._names({'prefix': 'des'})
+        Tag.objects.create(user=self.user, name='Vegemite')
+        self.assertIn('Vegemite', self._names({'prefix': 'veg'}))
+
+    def test_prefix_trie_expires(self):
+        with patch.object(trie_cache, 'ttl', 0):
+            self._names({'prefix': 'veg'})
+        # written by another worker, whose version bump never reaches this process
+        Tag.objects.bulk_create([Tag(user=self.user, name='Vegemite')])
+        self.assertIn('Vegemite', self._names({'prefix': 'veg'}))
+
+    def test_prefix_limited_to_user(self):
+        other_user = get_user_model().objects.create_user('other@gmail.com', 'testTEST12345')
+        Tag.objects.create(user=other_user, name='Veggie')
+        self.assertNotIn('Veggie', self._names({'prefix': 'veg'}))
+
+    def test_search_substring(self):
+        self.assertEqual(self._names({'search': 'sser'}), ['Dessert'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram search needs postgres')
+    def test_search_tolerates_typos(self):
+        self.assertEqual(self._names({'search': 'desert', 'limit': 1}), ['Dessert'])
+
+    def test_prefix_or_search_required(self):
+        response = self.client.get(AUTOCOMPLETE_URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
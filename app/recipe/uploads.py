@@ -0,0 +1,122 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from PIL import Image
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+STAGING_DIR = 'uploads/tmp/'
+
+
+class ImageTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded image is too large.'
+    default_code = 'image_too_large'
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """
+    a temporary upload kept under MEDIA_ROOT, so the storage can move it
+    into place with a rename instead of copying it
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        directory = os.path.join(settings.MEDIA_ROOT, STAGING_DIR)
+        os.makedirs(directory, exist_ok=True)
+        _, extension = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + extension, dir=directory)
+        super(TemporaryUploadedFile, self).__init__(file, name, content_type, size, charset, content_type_extra)
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """writes uploads to disk chunk by chunk, hashing them and enforcing RECIPE_IMAGE_MAX_BYTES"""
+
+    def new_file(self, *args, **kwargs):
+        super(TemporaryFileUploadHandler, self).new_file(*args, **kwargs)
+        self.file = StagedUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.file.close()
+            raise ImageTooLarge()
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.content_hash = self.sha256.hexdigest()
+        return file
+
+
+class StreamingMultiPartParser(MultiPartParser):
+    """multipart parser that stores files through HashingUploadHandler"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        upload_handlers = [HashingUploadHandler(request)]
+
+        try:
+            parser = DjangoMultiPartParser(meta, stream, upload_handlers, encoding)
+            data, files = parser.parse()
+            return DataAndFiles(data, files)
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
+
+
+def content_hash(file):
+    """sha256 of an uploaded file, reusing the digest taken while it streamed in"""
+    digest = getattr(file, 'content_hash', None)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        for chunk in file.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+        file.seek(0)
+    return digest
+
+
+class BoundedImageField(serializers.ImageField):
+    """image field that checks the dimensions from the image header before the image is decoded"""
+    default_error_messages = {
+        'too_large': 'Image dimensions must not exceed {max_side}px per side or {max_pixels} pixels.',
+    }
+
+    def to_internal_value(self, data):
+        if hasattr(data, 'read'):
+            self._check_dimensions(data)
+        return super().to_internal_value(data)
+
+    def _check_dimensions(self, data):
+        try:
+            # opening only parses the header, pixel data is decoded lazily
+            with Image.open(data) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self._fail_too_large()
+        except Exception:
+            # not an image, the parent field reports it
+            return
+        finally:
+            data.seek(0)
+        if max(width, height) > settings.RECIPE_IMAGE_MAX_SIDE or width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self._fail_too_large()
+
+    def _fail_too_large(self):
+        self.fail(
+            'too_large',
+            max_side=settings.RECIPE_IMAGE_MAX_SIDE,
+            max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS,
+        )
@@ -1,83 +1,274 @@
+from django.conf import settings
+from django.db.models import Count, Exists, OuterRef
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
+from core.authentication import CachedTokenAuthentication
 from core.models import Recipe, Tag, Ingredient
+from recipe.autocomplete import DEFAULT_RESULTS, MAX_RESULTS, complete, fuzzy_search
+from recipe.bulk import (
+    BulkDeleteSerializer,
+    IngredientBulkSerializer,
+    RecipeBulkSerializer,
+    TagBulkSerializer,
+)
+from recipe.cache import get_attr_list, set_attr_list
+from recipe.conditional import ConditionalGetMixin
+from recipe.export import CONTENT_TYPES as EXPORT_CONTENT_TYPES, RENDERERS as EXPORT_RENDERERS, iter_recipes
+from recipe.fastpath import FastRecipeSerializer
+from recipe.filters import RecipeRelationFilter, RecipeSearchFilter
+from recipe.images import schedule_variants
+from recipe.pagination import NameKeysetPagination, RecipeKeysetPagination
+from recipe.search import is_supported as search_ranking_supported
 from recipe.serializers import (
     RecipeDetailSerializer,
     RecipeImageSerializer,
     RecipeSerializer,
     TagSerializer,
-    IngredientSerializer
+    TagUsageSerializer,
+    IngredientSerializer,
+    IngredientUsageSerializer,
+)
+from recipe.similarity import (
+    DEFAULT_RESULTS as SIMILAR_DEFAULT_RESULTS,
+    MAX_RESULTS as SIMILAR_MAX_RESULTS,
+    similar as similar_recipes,
 )
+from recipe.stats import DEFAULT_TOP as STATS_DEFAULT_TOP, MAX_TOP as STATS_MAX_TOP, summary as stats_summary
+from recipe.sync import DEFAULT_LIMIT as SYNC_DEFAULT_LIMIT, MAX_LIMIT as SYNC_MAX_LIMIT, changes_since
+from recipe.uploads import StreamingMultiPartParser
+
+
+def bulk_response(view, request, output_serializer_class):
+    """runs a bulk request against the user's objects, output_serializer_class renders the result"""
+    queryset = view.get_queryset()
+    if request.method == 'DELETE':
+        serializer = BulkDeleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'deleted': serializer.delete(queryset, request.user.pk)}, status=status.HTTP_200_OK)
+
+    instance = queryset if request.method == 'PATCH' else None
+    serializer = view.get_serializer(instance, data=request.data, many=True, partial=instance is not None)
+    serializer.is_valid(raise_exception=True)
+    objects = serializer.save()
 
+    # re-read with the prefetches the output serializer needs
+    queryset = view.queryset.model.objects.filter(pk__in=[obj.pk for obj in objects]).order_by('id')
+    if hasattr(output_serializer_class, 'setup_eager_loading'):
+        queryset = output_serializer_class.setup_eager_loading(queryset)
+    output = output_serializer_class(queryset, many=True, context=view.get_serializer_context())
+    response_status = status.HTTP_200_OK if instance is not None else status.HTTP_201_CREATED
+    return Response(output.data, status=response_status)
 
-class BaseRecipeAttr(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin):
-    authentication_classes = (TokenAuthentication, )
+
+class BaseRecipeAttr(ConditionalGetMixin, viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin):
+    authentication_classes = (CachedTokenAuthentication, )
     permission_classes = (IsAuthenticated, )
+    pagination_class = NameKeysetPagination
+    # actions whose safe requests may read from a replica, see core.middleware
+    replica_actions = ('list', )
+
+    orderings = {
+        'name': ('-name', 'id'),
+        'usage': ('-recipe_count', 'id'),
+    }
+
+    def _assigned_only(self):
+        return bool(self.request.query_params.get('assigned_only'))
+
+    def _with_counts(self):
+        return bool(self.request.query_params.get('with_counts'))
+
+    def _ordering(self):
+        ordering = self.request.query_params.get('ordering', 'name')
+        if ordering not in self.orderings:
+            raise ValidationError({'ordering': f'Must be one of: {", ".join(self.orderings)}.'})
+        return ordering
 
     def get_queryset(self):
         """only returns objects for current authenticated user"""
-        assigned_only = bool(self.request.query_params.get('assigned_only'))
-        queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(user=self.request.user).order_by('-name')
+        queryset = self.queryset.filter(user=self.request.user)
+        if self._assigned_only():
+            # EXISTS on the through table, a join would repeat objects used by several recipes
+            through = self.queryset.model.recipe_set.through
+            column = f'{self.queryset.model._meta.model_name}_id'
+            queryset = queryset.filter(Exists(through.objects.filter(**{column: OuterRef('pk')})))
+        if self._with_counts() or self._ordering() == 'usage':
+            queryset = queryset.annotate(recipe_count=Count('recipe'))
+        return queryset.order_by(*self.get_keyset_ordering())
+
+    def get_keyset_ordering(self):
+        return self.orderings[self._ordering()]
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(request, self._list, *args, **kwargs)
+
+    def _list(self, request, *args, **kwargs):
+        """serves unpaginated lists from the per user cache"""
+        # skips ConditionalGetMixin.list, the conditional check already ran
+        list_objects = mixins.ListModelMixin.list
+        if self.paginator is not None and self.paginator.is_requested(request):
+            return list_objects(self, request, *args, **kwargs)
+
+        model = self.queryset.model
+        variant = ':'.join((
+            f'assigned_only={int(self._assigned_only())}',
+            f'with_counts={int(self._with_counts())}',
+            f'ordering={self._ordering()}',
+        ))
+        version = self.collection_version
+        data = get_attr_list(model, request.user.id, version, variant)
+        if data is None:
+            response = list_objects(self, request, *args, **kwargs)
+            set_attr_list(model, request.user.id, version, variant, response.data)
+            return response
+        return Response(data)
+
+    def get_serializer_class(self):
+        if self.action == 'bulk':
+            return self.bulk_serializer_class
+        if self.action == 'list' and self._with_counts():
+            return self.usage_serializer_class
+        return super().get_serializer_class()
 
     def perform_create(self, serializer):
         """add current authenticated user to tag"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """creates, updates or deletes many objects of the user in one transaction"""
+        return bulk_response(self, request, self.serializer_class)
+
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        """top matches for ?prefix= (completion) or ?search= (typo tolerant), capped by ?limit="""
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_RESULTS))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        limit = max(1, min(limit, MAX_RESULTS))
+
+        prefix = request.query_params.get('prefix', '').strip()
+        term = request.query_params.get('search', '').strip()
+        if prefix:
+            matches = complete(self.queryset, request.user.id, prefix, limit)
+        elif term:
+            matches = fuzzy_search(self.queryset, request.user.id, term, limit)
+        else:
+            raise ValidationError({'prefix': 'Either prefix or search is required.'})
+        return Response([{'id': pk, 'name': name} for pk, name in matches])
+
 
 class TagViewSet(BaseRecipeAttr):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    bulk_serializer_class = TagBulkSerializer
+    usage_serializer_class = TagUsageSerializer
 
 
 class IngredientViewSet(BaseRecipeAttr):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    bulk_serializer_class = IngredientBulkSerializer
+    usage_serializer_class = IngredientUsageSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    authentication_classes = (TokenAuthentication, )
+    authentication_classes = (CachedTokenAuthentication, )
     permission_classes = (IsAuthenticated, )
-
-    def _params_to_int(self, qs):
-        """converts a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+    pagination_class = RecipeKeysetPagination
+    filter_backends = (RecipeRelationFilter, RecipeSearchFilter)
+    replica_actions = ('list', 'retrieve', 'export')
 
     def get_queryset(self):
         """only returns objects for current authenticated user"""
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_int(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_int(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-
+        queryset = self._setup_eager_loading(self.queryset)
         return queryset.filter(user=self.request.user).order_by('-id')
 
+    def get_keyset_ordering(self):
+        """ranked search results are paged in rank order"""
+        if self.request.query_params.get('q', '').strip() and search_ranking_supported(self.queryset.db):
+            return ('-search_rank', '-id')
+        return self.pagination_class.ordering
+
+    def _setup_eager_loading(self, queryset):
+        """lets the serializer in use for this action pick its prefetches"""
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'setup_eager_loading'):
+            return serializer_class.setup_eager_loading(queryset)
+        return queryset
+
     def get_serializer_class(self):
         """returns appropritae serializer class for detail and others"""
-        if self.action == 'retrieve':
+        if self.action == 'list' and settings.RECIPE_FAST_LIST:
+            return FastRecipeSerializer
+        elif self.action == 'retrieve':
             return RecipeDetailSerializer
         elif self.action == 'upload_image':
             return RecipeImageSerializer
+        elif self.action == 'bulk':
+            return RecipeBulkSerializer
         return super().get_serializer_class()
 
     def perform_create(self, serializer):
         """add current authenticated user to recipe"""
         serializer.save(user=self.request.user)
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """creates, updates or deletes many recipes of the user in one transaction"""
+        return bulk_response(self, request, RecipeSerializer)
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """the ?limit= recipes sharing the most tags and ingredients with this one, by jaccard similarity"""
+        recipe = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', SIMILAR_DEFAULT_RESULTS))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        limit = max(1, min(limit, SIMILAR_MAX_RESULTS))
+
+        scores = dict(similar_recipes(request.user.id, recipe.id, limit))
+        recipes = RecipeSerializer.setup_eager_loading(Recipe.objects.filter(pk__in=scores))
+        recipes = sorted(recipes, key=lambda item: (-scores[item.pk], item.pk))
+        data = RecipeSerializer(recipes, many=True, context=self.get_serializer_context()).data
+        for item in data:
+            item['similarity'] = round(scores[item['id']], 4)
+        return Response(data)
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """recipe count, time and price averages and percentiles, and the ?top= most used tags and ingredients"""
+        try:
+            top = int(request.query_params.get('top', STATS_DEFAULT_TOP))
+        except ValueError:
+            raise ValidationError({'top': 'Must be an integer.'})
+        top = max(1, min(top, STATS_MAX_TOP))
+        return Response(stats_summary(request.user.id, top))
+
+    @action(methods=['GET'], detail=False)
+    def export(self, request):
+        """streams every recipe of the user with nested tags and ingredients, ?output=json (default) or ndjson"""
+        output = request.query_params.get('output', 'json')
+        if output not in EXPORT_RENDERERS:
+            raise ValidationError({'output': f'Must be one of: {", ".join(EXPORT_RENDERERS)}.'})
+        # the filters still apply, the prefetches are made per chunk
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        items = iter_recipes(queryset, self.get_serializer_context())
+        response = StreamingHttpResponse(EXPORT_RENDERERS[output](items), content_type=EXPORT_CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="recipes.{output}"'
+        return response
+
+    @action(methods=['POST'], detail=True, url_path='upload-image', parser_classes=(StreamingMultiPartParser, ))
     def upload_image(self, request, pk=None):
         """upload an image to a recipe"""
         recipe = self.get_object()
@@ -86,7 +277,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data=request.data
         )
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(image_variants={})
+            schedule_variants(recipe.id)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -95,3 +287,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+
+class SyncView(APIView):
+    """changes to the user's recipes, tags and ingredients after ?cursor=, in pages of ?limit= log entries"""
+    authentication_classes = (CachedTokenAuthentication, )
+    permission_classes = (IsAuthenticated, )
+
+    def _int_param(self, name, default):
+        value = self.request.query_params.get(name, default)
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError({name: 'Must be an integer.'})
+        if value < 0:
+            raise ValidationError({name: 'Must not be negative.'})
+        return value
+
+    def get(self, request):
+        cursor = self._int_param('cursor', 0)
+        limit = max(1, min(self._int_param('limit', SYNC_DEFAULT_LIMIT), SYNC_MAX_LIMIT))
+        return Response(changes_since(request.user, cursor, limit, {'request': request}))